@@ -1,12 +1,16 @@
 from pathlib import Path
 
-from matplotlib import rcParams
+import tomlkit
 
 FIG_SIZE = 8, 4.8
-rcParams["font.family"] = "sans-serif"
-rcParams["font.sans-serif"] = ["Inter"]
 
 base_dir = Path(__file__).parent.parent
+config = tomlkit.loads((base_dir / "config.toml").read_text())
+
+# file format of the plots: svg, svgz or png
+PLOT_FORMAT = str(config.get("PLOT_FORMAT", "svg"))
+PLOT_DPI = int(config.get("PLOT_DPI", 100))
+PLOT_REPORT = bool(config.get("PLOT_REPORT", False))
 
 config_dir = base_dir / "config"
 config_dir.mkdir(exist_ok=True)
@@ -0,0 +1,88 @@
+"""In-memory summaries of LatticeJSON dicts, e.g. for optimizer loops.
+
+    from actions import api
+
+    summary = api.summary(lattice_dict, energy=1700, codes=["madx"])
+    metrics = api.metrics(lattice_dict, energy=1700, codes=["madx"])
+    all_metrics = api.batch(candidates, energy=1700, codes=["madx"])
+
+Unlike the doit actions, nothing is read from or written to disk and no plots
+are rendered. The tables are the same as in the summaries on the website,
+`metrics` flattens them into a dict of label -> value per code. `batch`
+evaluates many lattices on the warm worker pool.
+"""
+
+import os
+from functools import partial
+
+from . import lattice_info, pool, tables
+
+codes = ["apace", "madx"]
+
+
+def info_table(lattice_dict, energy, periodic=False):
+    "Returns the lattice info table"
+    return lattice_info.info_table({"energy": energy}, lattice_dict)
+
+
+def apace_tables(lattice_dict, energy, periodic=False):
+    "Returns the twiss tables computed by apace"
+    import apace as ap
+
+    from .twiss_apace import twiss_simulation, twiss_tables
+
+    section, n_sections = _section(lattice_dict, periodic)
+    lattice = ap.Lattice.from_dict(lattice_dict)
+    twiss = twiss_simulation(lattice.children[0] if section else lattice, energy)
+    return twiss_tables(twiss, n_sections)
+
+
+def madx_tables(lattice_dict, energy, periodic=False):
+    "Returns the twiss tables computed by MAD-X"
+    import latticejson
+
+    from .twiss_madx import twiss_of_input, twiss_tables
+
+    section, n_sections = _section(lattice_dict, periodic)
+    madx_input = latticejson.io.save_string(lattice_dict, "madx")
+    return twiss_tables(twiss_of_input(madx_input, energy, section), n_sections)
+
+
+functions = {"lattice_info": info_table, "apace": apace_tables, "madx": madx_tables}
+
+
+def summary(lattice_dict, energy, codes=codes, periodic=False) -> dict:
+    """Returns a dict of `lattice_info` and of the `codes` -> tables.
+
+    With `periodic`, only one of the identical sections of the ring is computed.
+    """
+    return {
+        name: functions[name](lattice_dict, energy, periodic)
+        for name in ["lattice_info", *codes]
+    }
+
+
+def metrics(lattice_dict, energy, codes=codes, periodic=False) -> dict:
+    "Returns a dict of `lattice_info` and of the `codes` -> label -> value"
+    result = summary(lattice_dict, energy, codes, periodic)
+    return {name: tables.values(table) for name, table in result.items()}
+
+
+def batch(lattice_dicts, energy, codes=codes, periodic=False, flat=True) -> list:
+    """Returns the `metrics` (or with `flat=False` the `summary`) of many lattices.
+
+    The lattices are spread over the warm worker pool, which is kept for the
+    next call.
+    """
+    function = partial(
+        metrics if flat else summary, energy=energy, codes=codes, periodic=periodic
+    )
+    lattice_dicts = list(lattice_dicts)
+    chunksize = max(len(lattice_dicts) // (4 * os.cpu_count()), 1)
+    return list(pool.executor().map(function, lattice_dicts, chunksize=chunksize))
+
+
+def _section(lattice_dict, periodic):
+    if not periodic:
+        return None, 1
+    return lattice_info.symmetric_section(lattice_dict)
@@ -0,0 +1,170 @@
+"""Comparison of the results of the simulation codes for the same lattice.
+
+The optics arrays of every code are compared at the positions of the code with
+the fewest samples within the range all codes share. These are usually the
+element ends of MAD-X, which are also slice ends of the sliced codes, so the
+codes are compared at their own samples. Interpolating a coarse code at the
+slice points of a fine one would instead measure the interpolation error, e.g.
+about γL²/4 for β across a drift of length L. Only where a code has no sample
+it is interpolated linearly, the weights are computed once per code and applied
+to all its columns at once. The deviations of every code from the reference
+code (the first of `codes` which simulated the lattice) are written as summary
+tables, together with a plot of the deviations along the lattice.
+"""
+
+import json
+from pathlib import Path
+
+from . import PLOT_FORMAT, optics_export
+from .metrics_db import metric_key
+from .plotting import BUDGET, decimate, new_figure, render
+from .tables import values
+from .timing import span
+
+# in order of preference for the reference
+codes = ["madx", "apace", "elegant"]
+
+targets = ["code_comparison.json", f"code_comparison.{PLOT_FORMAT}"]
+
+# optics column -> label
+optics = {"beta_x": "βₓ", "beta_y": "βᵧ", "eta_x": "ηₓ", "eta_y": "ηᵧ"}
+
+# key of `metric_key` -> label
+scalars = {
+    "tune_x": "Qₓ",
+    "tune_y": "Qᵧ",
+    "chromaticity_x": "dQₓ / dδ",
+    "chromaticity_y": "dQᵧ / dδ",
+    "momentum_compaction": "Mom. compaction",
+    "emittance_x": "Emittance",
+    "i1": "I₁",
+    "i2": "I₂",
+    "i3": "I₃",
+    "i4": "I₄",
+    "i5": "I₅",
+}
+
+
+def action(sources: dict, output_dir: Path):
+    """Compare the results of the codes and write the tables and the plot.
+
+    `sources` is a dict of code -> (path of the optics, path of the tables).
+    """
+    with span("resample"):
+        names = list(sources)
+        grid, resampled = common_grid(
+            [optics_export.load(sources[code][0]) for code in names]
+        )
+        resampled = dict(zip(names, resampled))
+    scalar_values = {
+        code: {metric_key(k): v for k, v in values(_read(tables_path)).items()}
+        for code, (_, tables_path) in sources.items()
+    }
+
+    print(f"Comparing {', '.join(names)} 🔍")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    reference, *others = names
+    with span("tables"):
+        comparison = [
+            [
+                f"{code} vs. {reference}",
+                [
+                    optics_deviations(resampled[reference], resampled[code]),
+                    scalar_deviations(scalar_values[reference], scalar_values[code]),
+                ],
+            ]
+            for code in others
+        ]
+        (output_dir / targets[0]).write_text(json.dumps(comparison))
+    render(output_dir / targets[1], deviation_plot, grid, resampled)
+
+
+def common_grid(columns: list):
+    """Returns the common s-grid, the positions of the code with the fewest samples,
+    and the `columns` (dicts of the optics columns of every code) resampled onto
+    it, only with the columns of `optics`.
+    """
+    import numpy as np
+
+    start = max(c["s"][0] for c in columns)
+    stop = min(c["s"][-1] for c in columns)
+    grid = np.unique(min((c["s"] for c in columns), key=len))
+    grid = grid[(grid >= start) & (grid <= stop)]
+    result = []
+    for c in columns:
+        names = [name for name in optics if name in c]
+        stacked = resample(c["s"], np.array([c[name] for name in names]), grid)
+        result.append(dict(zip(names, stacked)))
+    return grid, result
+
+
+def resample(s, stacked, grid):
+    """Linear interpolation of the rows of `stacked` at the sorted positions `grid`,
+    at positions of `s` the values of its last sample there are returned as is.
+    """
+    import numpy as np
+
+    s = np.asarray(s)
+    # the right neighbour of every grid point, zero-length elements repeat an s
+    right = np.clip(np.searchsorted(s, grid, "right"), 1, len(s) - 1)
+    left = right - 1
+    length = s[right] - s[left]
+    weight = np.divide(
+        grid - s[left], length, out=np.zeros_like(grid, float), where=length > 0
+    )
+    return stacked[:, left] * (1 - weight) + stacked[:, right] * weight
+
+
+def optics_deviations(reference: dict, other: dict):
+    "Returns the table rows of the deviations of the optics along the lattice"
+    import numpy as np
+
+    rows = []
+    for name, label in optics.items():
+        if name not in reference or name not in other:
+            continue
+        deviation = np.abs(other[name] - reference[name])
+        scale = np.max(np.abs(reference[name]))
+        rows += [
+            [f"max |Δ{label}| / m", float(np.max(deviation))],
+            [f"rms Δ{label} / m", float(np.sqrt(np.mean(deviation**2)))],
+        ]
+        if scale > 0:
+            rows.append(
+                [f"max |Δ{label}| / {label},ₘₐₓ", float(np.max(deviation) / scale)]
+            )
+    return rows
+
+
+def scalar_deviations(reference: dict, other: dict):
+    "Returns the table rows of the relative deviations of the ring parameters"
+    return [
+        [f"Δ{label} / {label}", abs(other[key] - reference[key]) / abs(reference[key])]
+        for key, label in scalars.items()
+        if key in reference and key in other and reference[key]
+    ]
+
+
+def deviation_plot(grid, resampled: dict, budget=BUDGET):
+    reference, *others = resampled
+    fig = new_figure()
+    ax = fig.subplots()
+    for code in others:
+        names = [name for name in optics if name in resampled[code]]
+        names = [name for name in names if name in resampled[reference]]
+        s, *deviations = decimate(
+            grid,
+            *(resampled[code][name] - resampled[reference][name] for name in names),
+            budget=budget,
+        )
+        for name, deviation in zip(names, deviations):
+            ax.plot(s, deviation, label=f"Δ{optics[name]} {code}")
+    ax.set_xlabel("Orbit Position $s$ / m")
+    ax.set_ylabel(f"Deviation from {reference} / m")
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+
+def _read(path):
+    return json.loads(Path(path).read_text())
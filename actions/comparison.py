@@ -0,0 +1,130 @@
+"""Cross-lattice comparison dataset for the website, one shard per namespace.
+
+Instead of fetching the tables of every lattice and simulation code, the website
+fetches one shard per namespace with the numeric rows of all tables. A shard is
+column-oriented: for every code (and `lattice_info`) and metric there is one
+column with the values of all lattices of the namespace, `null` where a lattice
+lacks the metric. Along with the columns, a shard holds the modification time
+and size of every tables file it was built from and the fingerprint of the code
+which reads them, only the rows of unchanged files are reused on an update. The
+shards are written with precompressed gzip and, if the brotli package is
+installed, brotli variants for static hosting.
+"""
+
+import gzip
+import json
+from pathlib import Path
+
+from . import tables
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# changed whenever the layout of the shards changes, older shards are not reused
+FORMAT = 2
+
+# tables files modified less than this before the previous shard are read again,
+# a rewrite within the timestamp granularity keeps the modification time / ns
+RACY_TIME = 1_000_000_000
+
+suffixes = [".json", ".json.gz"] + ([".json.br"] if brotli else [])
+
+
+def update(shard_path: Path, namespace, sources: dict):
+    """doit action: write the shard of `namespace` with the tables `sources`.
+
+    `sources` is a dict of lattice name -> code -> path of the summary tables.
+    The tables of a lattice are only read again if the modification time or size
+    of one of its files differs from the previous shard, or if the code reading
+    them changed, otherwise its rows are taken from the previous shard.
+    """
+    from .dependencies import fingerprint
+
+    reader = fingerprint(tables.values)
+    previous = load(shard_path)
+    if previous is None or previous.get("reader") != reader:
+        previous = None
+    previous_rows = rows(previous)
+    previous_stamps = previous["sources"] if previous_rows else {}
+    built = shard_path.stat().st_mtime_ns if previous_rows else 0
+    lattices, stamps = {}, {}
+    for name, paths in sources.items():
+        stamps[name] = {code: stamp(path) for code, path in paths.items()}
+        unchanged = previous_stamps.get(name) == stamps[name] and all(
+            mtime < built - RACY_TIME for mtime, _ in stamps[name].values()
+        )
+        if name in previous_rows and unchanged:
+            lattices[name] = previous_rows[name]
+        else:
+            lattices[name] = {
+                code: tables.values(json.loads(Path(path).read_text()))
+                for code, path in paths.items()
+            }
+    save(shard_path, shard(namespace, lattices, stamps, reader))
+
+
+def stamp(path) -> list:
+    "Returns the modification time and size of a file, as stored in the shard"
+    stat = Path(path).stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def shard(namespace, lattices: dict, stamps=None, reader=None) -> dict:
+    """Returns the column-oriented shard of a dict lattice -> code -> metric -> value.
+
+    `stamps` is a dict lattice -> code -> `stamp` of the tables file and `reader`
+    the fingerprint of the code which read them.
+    """
+    names = sorted(lattices)
+    columns = {}
+    for i, name in enumerate(names):
+        for code, values in lattices[name].items():
+            for metric, value in values.items():
+                column = columns.setdefault(code, {}).setdefault(
+                    metric, [None] * len(names)
+                )
+                column[i] = value
+    return {
+        "format": FORMAT,
+        "namespace": namespace,
+        "lattices": names,
+        "columns": columns,
+        "sources": stamps or {},
+        "reader": reader,
+    }
+
+
+def rows(data) -> dict:
+    "Inverse of `shard`, returns a dict of lattice -> code -> metric -> value"
+    if data is None or data.get("format") != FORMAT:
+        return {}
+    lattices = {name: {} for name in data["lattices"]}
+    for code, metrics in data["columns"].items():
+        for metric, column in metrics.items():
+            for name, value in zip(data["lattices"], column):
+                if value is not None:
+                    lattices[name].setdefault(code, {})[metric] = value
+    return lattices
+
+
+def load(shard_path: Path):
+    "Returns the shard at `shard_path` or None if there is none"
+    try:
+        return json.loads(shard_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save(shard_path: Path, data):
+    "Write the shard as compact json and its precompressed variants"
+    content = json.dumps(data, separators=(",", ":")).encode()
+    shard_path.parent.mkdir(parents=True, exist_ok=True)
+    shard_path.write_bytes(content)
+    # mtime=0 to get the same bytes for the same shard
+    compressed = {".gz": gzip.compress(content, 9, mtime=0)}
+    if brotli:
+        compressed[".br"] = brotli.compress(content)
+    for suffix, data in compressed.items():
+        shard_path.with_name(shard_path.name + suffix).write_bytes(data)
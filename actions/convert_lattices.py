@@ -1,7 +1,9 @@
-import latticejson
+from . import lattice_cache
 
 
 def action(source, targets):
-    lattice_file = latticejson.load(source)
+    import latticejson
+
+    lattice_file = lattice_cache.load(source)
     for target in targets:
         latticejson.save(lattice_file, target)
@@ -0,0 +1,196 @@
+"""Value-level dependencies of the doit tasks.
+
+Instead of depending on whole files, tasks depend on the code of the functions
+they run (`fingerprint`) and on the values they use (`value_changed`), e.g. the
+entry of a lattice in its info.toml. `ReasonReporter` shows why a task runs.
+"""
+
+import hashlib
+import inspect
+import json
+import sys
+import types
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+from doit.reporter import ConsoleReporter
+
+from . import base_dir, lattice_cache, render_pool, result_store, timing
+
+# task name -> reasons why it is not up-to-date
+reasons = defaultdict(list)
+
+
+@lru_cache(maxsize=None)
+def fingerprint(*functions) -> str:
+    """Returns a hash of the code of `functions` (or classes) and of everything they
+    use from the `actions` package: functions, classes and module-level constants.
+
+    Line numbers are not part of the code, so moving a function does not count as
+    a change. Third-party libraries are not tracked.
+    """
+    digest = hashlib.sha256()
+    queue, seen = list(functions), set()
+    while queue:
+        function = queue.pop()
+        if isinstance(function, type):
+            queue.extend(_tracked_functions([function]))
+            continue
+        key = f"{function.__module__}.{function.__qualname__}"
+        if key in seen:
+            continue
+        seen.add(key)
+        digest.update(key.encode())
+        names = _hash_code(function.__code__, digest)
+        for name in sorted(names):
+            if name not in function.__globals__:
+                continue  # builtin or attribute name
+            value = function.__globals__[name]
+            if isinstance(value, types.ModuleType):
+                if _is_tracked(value.__name__):
+                    # attributes of the module are among the names of the code
+                    values = {n: getattr(value, n) for n in names if hasattr(value, n)}
+                    queue.extend(_tracked_functions(values.values()))
+                    for attribute, constant in values.items():
+                        _hash_value(f"{value.__name__}.{attribute}", constant, digest)
+            elif _tracked_functions([value]):
+                queue.extend(_tracked_functions([value]))
+            else:
+                _hash_value(name, value, digest)
+    return digest.hexdigest()
+
+
+def _hash_code(code: types.CodeType, digest) -> set:
+    "Adds the bytecode and constants to `digest`, returns all names used"
+    digest.update(code.co_code)
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _hash_code(constant, digest)
+        elif isinstance(constant, frozenset):
+            digest.update(repr(sorted(constant, key=repr)).encode())
+        else:
+            digest.update(repr(constant).encode())
+    return names
+
+
+def _is_tracked(module_name):
+    return module_name == "actions" or module_name.startswith("actions.")
+
+
+def _tracked_functions(values):
+    "Returns the functions (also methods of classes) defined in `actions`"
+    functions = []
+    for value in values:
+        if callable(value):
+            value = inspect.unwrap(value)  # e.g. decorated by lru_cache
+        if isinstance(value, type) and _is_tracked(value.__module__):
+            functions += _tracked_functions(vars(value).values())
+        elif isinstance(value, types.FunctionType) and _is_tracked(value.__module__):
+            functions.append(value)
+    return functions
+
+
+def _hash_value(name, value, digest):
+    "Adds plain data like lists of targets or dicts of profiles to `digest`"
+    if isinstance(value, (types.ModuleType, types.FunctionType, type)):
+        return
+    try:
+        data = json.dumps(value, sort_keys=True, default=_portable)
+    except (TypeError, ValueError):
+        return  # not plain data, e.g. a lock
+    digest.update(f"{name}={data}".encode())
+
+
+def _portable(value):
+    "Like `_plain`, but paths inside the checkout are relative to it"
+    if isinstance(value, Path) and value.is_absolute():
+        try:
+            return str(value.relative_to(base_dir))
+        except ValueError:
+            pass
+    return _plain(value)
+
+
+def _plain(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError
+
+
+class value_changed:
+    """doit uptodate check which is False if `value` changed since the last run.
+
+    Like `doit.tools.config_changed`, but several checks can be used by the same
+    task and the reason is recorded for `ReasonReporter`.
+    """
+
+    def __init__(self, label, value):
+        self.label = label
+        self.key = f"_value_changed:{label}"
+        data = json.dumps(value, sort_keys=True, default=_plain)
+        self.digest = hashlib.md5(data.encode()).hexdigest()
+
+    def configure_task(self, task):
+        task.value_savers.append(lambda: {self.key: self.digest})
+
+    def __call__(self, task, values):
+        previous = values.get(self.key)
+        if previous == self.digest:
+            return True
+        reasons[task.name].append(f"{self.label} changed" if previous else "first run")
+        return False
+
+    def __repr__(self):
+        return f"value_changed({self.label!r})"
+
+
+def code_changed(*functions):
+    "Returns a `value_changed` check of the code of `functions`"
+    label = "code of " + ", ".join(function.__name__ for function in functions)
+    return value_changed(label, fingerprint(*functions))
+
+
+def why(task) -> list:
+    "Returns the reasons why `task` is executed"
+    missing = [
+        Path(target).name for target in task.targets if not Path(target).exists()
+    ]
+    result = list(dict.fromkeys(reasons.pop(task.name, [])))
+    if missing:
+        result.append(f"missing {', '.join(missing)}")
+    else:
+        result += [f"{Path(dep).name} changed" for dep in task.dep_changed]
+    return result
+
+
+class ReasonReporter(ConsoleReporter):
+    "Console reporter which also shows why a task is executed and the timings"
+
+    def execute_task(self, task):
+        if task.actions and task.name[0] != "_":
+            text = "; ".join(why(task))
+            self.write(f".  {task.title()}" + (f"  ({text})" if text else "") + "\n")
+
+    def complete_run(self):
+        failed = render_pool.wait()
+        for task_name, error in failed.items():
+            self.write(f"Rendering {task_name} failed, it runs again next time:\n")
+            self.write(error)
+        super().complete_run()
+        result = timing.report()
+        if result is not None:
+            slowest = [("lattices", "slowest_lattices"), ("stages", "slowest_stages")]
+            for title, key in slowest:
+                items = ", ".join(f"{name} {wall:.2f} s" for name, wall in result[key])
+                self.write(f"Slowest {title} ⏱: {items}\n")
+        # once per run, every prune stats all entries
+        lattice_cache.prune()
+        result_store.prune(interval=result_store.PRUNE_INTERVAL)
+        if failed:
+            # doit has already decided on its exit code, the renders ran after
+            # their tasks had succeeded
+            sys.exit(1)
@@ -0,0 +1,70 @@
+"""Persistent index of the info.toml files in the data directory.
+
+An info.toml is only read again when its modification time or size changed and
+only parsed again when its content hash differs from the indexed one.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import tomlkit
+
+
+def load(data_dir: Path, index_path: Path, namespaces=None) -> dict:
+    """Returns a dict of info.toml path -> lattices of the namespace.
+
+    If `namespaces` is given, only the info.toml files of these namespaces are
+    read, as long as they are already known to the index.
+    """
+    try:
+        index = json.loads(index_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {}
+
+    known = {entry["namespace"]: path for path, entry in index.items()}
+    if namespaces is not None and all(
+        namespace in known and (data_dir / known[namespace]).exists()
+        for namespace in namespaces
+    ):
+        paths = [data_dir / known[namespace] for namespace in namespaces]
+    else:
+        paths = sorted(data_dir.rglob("info.toml"))
+        namespaces = None
+
+    changed = False
+    result = {}
+    for path in paths:
+        key = str(path.relative_to(data_dir))
+        stat = path.stat()
+        entry = index.get(key)
+        if entry is None or (entry["mtime_ns"], entry["size"]) != (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            content = path.read_bytes()
+            sha256 = hashlib.sha256(content).hexdigest()
+            if entry is None or entry["sha256"] != sha256:
+                entry = {
+                    "namespace": path.parent.stem,
+                    "sha256": sha256,
+                    # convert to plain python objects
+                    "lattices": json.loads(json.dumps(tomlkit.loads(content.decode()))),
+                }
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            index[key] = entry
+            changed = True
+        result[path] = entry["lattices"]
+
+    if namespaces is None:  # full scan, forget removed info.toml files
+        for key in set(index) - {str(path.relative_to(data_dir)) for path in paths}:
+            del index[key]
+            changed = True
+
+    if changed:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(index))
+        tmp.replace(index_path)
+    return result
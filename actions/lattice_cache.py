@@ -0,0 +1,103 @@
+"""On-disk cache of parsed lattice files shared by all stages.
+
+Entries are keyed by the content hash of the lattice file and stored as pickles,
+so a stage loads a ready structure instead of parsing the lattice file again.
+Entries which were not used for `MAX_AGE` seconds are evicted, after that the
+least recently used entries until the cache is smaller than `MAX_SIZE` bytes,
+once at the end of a run.
+"""
+
+import hashlib
+import os
+import pickle
+import time
+from pathlib import Path
+
+from . import base_dir
+
+cache_dir = base_dir / "_cache" / "lattices"
+
+MAX_SIZE = 512 * 1024 * 1024
+MAX_AGE = 30 * 24 * 60 * 60
+
+
+def content_hash(path: Path) -> str:
+    "Returns the sha256 hex digest of the file at `path`"
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def load(path: Path) -> dict:
+    "Returns the LatticeJSON dict of the lattice file at `path`"
+    import latticejson
+
+    return _cached(path, "dict", lambda: latticejson.load(path))
+
+
+def flattened(path: Path, start_lattice=None) -> list:
+    "Returns the flattened element sequence of `start_lattice` (default: root)"
+    from latticejson.utils import flattened_element_sequence
+
+    kind = "flattened" if start_lattice is None else f"flattened-{start_lattice}"
+    return _cached(
+        path, kind, lambda: list(flattened_element_sequence(load(path), start_lattice))
+    )
+
+
+def apace_lattice(path: Path):
+    "Returns the apace Lattice object built from the lattice file at `path`"
+    import apace as ap
+
+    return _cached(
+        path, f"apace-{ap.__version__}", lambda: ap.Lattice.from_dict(load(path))
+    )
+
+
+def _cached(path, kind, build):
+    import latticejson
+
+    path = Path(path)
+    key = f"{content_hash(path)}-{path.suffix[1:]}-{latticejson.__version__}"
+    entry = cache_dir / f"{key}.{kind}.pickle"
+    try:
+        with entry.open("rb") as file:
+            value = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        value = build()
+        _store(entry, value)
+    else:
+        os.utime(entry)  # the modification time marks the last use
+    return value
+
+
+def _store(entry: Path, value):
+    try:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError, RecursionError):
+        return  # not every object can be pickled, build it every time instead
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(entry)
+
+
+def prune(max_size=MAX_SIZE, max_age=MAX_AGE):
+    "Evict entries older than `max_age` and the oldest until below `max_size`"
+    now = time.time()
+    entries = []
+    for entry in cache_dir.glob("*.pickle"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue  # removed by a concurrent process
+        if now - stat.st_mtime > max_age:
+            entry.unlink(missing_ok=True)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+    size = sum(size for _, size, _ in entries)
+    for _, entry_size, entry in sorted(entries):
+        if size <= max_size:
+            break
+        entry.unlink(missing_ok=True)
+        size -= entry_size
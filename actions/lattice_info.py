@@ -1,19 +1,32 @@
 import json
+from collections import Counter
 from itertools import groupby
 
-import latticejson
-from latticejson.utils import flattened_element_sequence
+from .lattice_cache import load
+from .timing import span
 
 targets = ["lattice_info.json"]
 
+# rows of the totals of a (sub-)lattice, its columns are the element types
+quantities = ["count", "length", "bends", "reverse_bends"]
+COUNT, LENGTH, BENDS, REVERSE_BENDS = range(len(quantities))
+
 
 def action(lattice, lattice_path, output_dir):
     output_dir.mkdir(exist_ok=True, parents=True)
-    lattice_dict = latticejson.load(lattice_path)
+    table = info_table(lattice, load(lattice_path))
+    with (output_dir / targets[0]).open("w") as file:
+        json.dump(table, file)
+
+
+def info_table(lattice, lattice_dict):
+    "Returns the lattice info table of the info entry `lattice` and its LatticeJSON"
     elements = lattice_dict["elements"]
     ring = lattice_dict["lattices"][lattice_dict["root"]]
-    ring_flattened = flattened_element_sequence(lattice_dict)
-    circumference = sum(elements[name][1]["length"] for name in ring_flattened)
+    with span("structure totals"):
+        types, totals = structure_totals(lattice_dict)
+    ring_totals = totals[lattice_dict["root"]]
+    circumference = ring_totals[LENGTH].sum()
     is_fully_symmetric = all_equal(ring)
     table = [
         ["Energy / MeV", lattice["energy"]],
@@ -22,22 +35,78 @@ def action(lattice, lattice_path, output_dir):
         ["Number of sections", len(ring)],
     ]
     if is_fully_symmetric:
-        section_flattened = list(flattened_element_sequence(lattice_dict, ring[0]))
-        section_length = sum(elements[name][1]["length"] for name in section_flattened)
-        table.append(["Section length / m", section_length])
-        bends = [name for name in section_flattened if elements[name][0] == "Dipole"]
-        n_bends = sum(elements[name][1]["angle"] > 0 for name in bends)
-        n_reverse_bends = len(bends) - n_bends
-        table.append(["Bends per section", n_bends])
-        table.append(["Reverse bends per section", n_reverse_bends])
+        section_totals = totals[ring[0]]
+        table.append(["Section length / m", section_totals[LENGTH].sum()])
+        table.append(["Bends per section", int(section_totals[BENDS].sum())])
+        table.append(
+            ["Reverse bends per section", int(section_totals[REVERSE_BENDS].sum())]
+        )
         if "straight" in elements:
             straight_length = 2 * elements["straight"][1]["length"]
             table.append(["Straight length / m", straight_length])
             table.append(
                 ["Free straight ratio", straight_length * len(ring) / circumference]
             )
-    with (output_dir / targets[0]).open("w") as file:
-        json.dump(["Lattice Info", table], file)
+    for type_, (count, length, *_) in zip(types, ring_totals.T):
+        table.append([f"Number of {type_} elements", int(count)])
+        table.append([f"{type_} length fraction", length / circumference])
+    return ["Lattice Info", table]
+
+
+def structure_totals(lattice_dict):
+    """Returns the element types and a dict of element or lattice name -> totals.
+
+    The totals are arrays of the `quantities` per element type. Every lattice is
+    summed up only once from the totals of its distinct children times their
+    multiplicity, so the ring is never flattened.
+    """
+    import numpy as np
+
+    elements, lattices = lattice_dict["elements"], lattice_dict["lattices"]
+    types = sorted({type_ for type_, _ in elements.values()})
+    totals = {}
+    for name, (type_, attributes) in elements.items():
+        array = totals[name] = np.zeros((len(quantities), len(types)))
+        column = types.index(type_)
+        array[COUNT, column] = 1
+        array[LENGTH, column] = attributes.get("length", 0)
+        if type_ == "Dipole":
+            is_bend = attributes["angle"] > 0
+            array[BENDS if is_bend else REVERSE_BENDS, column] = 1
+
+    def total(name):
+        if name not in totals:
+            array = np.zeros((len(quantities), len(types)))
+            for child, multiplicity in Counter(lattices[name]).items():
+                array += multiplicity * total(child)
+            totals[name] = array
+        return totals[name]
+
+    for name in lattices:
+        total(name)
+    return types, totals
+
+
+def periodic_section(lattice, lattice_path):
+    """Returns the name and the number of the identical sections of the ring if the
+    periodic-cell mode is enabled for the lattice, otherwise (None, 1).
+    """
+    if not lattice.get("periodic", False):
+        return None, 1
+    section, n_sections = symmetric_section(load(lattice_path))
+    if section is None:
+        print("Lattice is not fully symmetric, use the whole ring ⚠")
+    return section, n_sections
+
+
+def symmetric_section(lattice_dict):
+    """Returns the name and the number of the identical sections of the ring, or
+    (None, 1) if the ring is not made of identical sections.
+    """
+    ring = lattice_dict["lattices"][lattice_dict["root"]]
+    if not (all_equal(ring) and ring[0] in lattice_dict["lattices"]):
+        return None, 1
+    return ring[0], len(ring)
 
 
 def all_equal(iterable):
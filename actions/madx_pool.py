@@ -0,0 +1,72 @@
+"""Pool of persistent MAD-X processes which are reused across lattices.
+
+After every job the sequences, beams and tables of the instance are deleted.
+An instance is recycled after `MAX_JOBS` jobs, when the job raised an error or
+when the job left global variables behind, which cannot be deleted in MAD-X.
+Element definitions remain, but every converted lattice file defines all of its
+elements again.
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from cpymad.madx import Madx
+
+MAX_JOBS = 50
+
+_idle = []
+_lock = Lock()
+
+
+@contextmanager
+def instance():
+    "Yields a clean MAD-X instance, which is reset and put back into the pool"
+    with _lock:
+        madx, jobs, baseline = _idle.pop() if _idle else _start()
+    try:
+        yield madx
+    except BaseException:
+        _quit(madx)
+        raise
+    if jobs + 1 < MAX_JOBS and _reset(madx, baseline):
+        with _lock:
+            _idle.append((madx, jobs + 1, baseline))
+    else:
+        _quit(madx)
+
+
+def clear():
+    "Quit all idle instances"
+    with _lock:
+        while _idle:
+            _quit(_idle.pop()[0])
+
+
+def _start():
+    from cpymad.madx import Madx
+
+    madx = Madx(stdout=False)
+    madx.options.info = False
+    return madx, 0, dict(madx.globals)
+
+
+def _reset(madx: "Madx", baseline) -> bool:
+    "Delete the state of the last job, returns False if the instance is not clean"
+    try:
+        for name in list(madx.sequence):
+            madx.input(f"delete, sequence={name};")
+        for name in list(madx.table):
+            madx.input(f"delete, table={name};")
+        madx.input("resbeam;")
+        return dict(madx.globals) == baseline
+    except Exception:
+        return False
+
+
+def _quit(madx: "Madx"):
+    try:
+        madx.quit()
+    except Exception:
+        pass  # the process may already be dead
@@ -0,0 +1,311 @@
+"""SQLite database of the metrics of all summaries, for queries across lattices.
+
+    poetry run doit metrics_db
+    poetry run python -m actions.metrics_db query "emittance_x < 1e-9" "circumference < 300"
+    poetry run python -m actions.metrics_db query "madx.tune_x > 2" --show tune_y
+    poetry run python -m actions.metrics_db keys
+
+The labels of the tables differ between the codes ("max beta x" vs "βₓ,ₘₐₓ / m"),
+so they are mapped to shared keys (`metric_keys`, unknown labels are turned into
+snake case). The database holds one value per lattice, code and metric and is
+indexed by metric and value. When it is built, only the tables files whose
+modification time or size changed are loaded again.
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+from pathlib import Path
+
+from . import base_dir, config, tables
+
+db_path = base_dir / str(config["RESULTS_DIR"]) / "metrics.sqlite"
+
+# label in the summary tables -> shared key
+metric_keys = {
+    # lattice_info
+    "Energy / MeV": "energy",
+    "Circumference / m": "circumference",
+    "Fully symmetric": "fully_symmetric",
+    "Number of sections": "n_sections",
+    "Section length / m": "section_length",
+    "Bends per section": "bends_per_section",
+    "Reverse bends per section": "reverse_bends_per_section",
+    "Straight length / m": "straight_length",
+    "Free straight ratio": "free_straight_ratio",
+    # apace
+    "Qₓ": "tune_x",
+    "Qᵧ": "tune_y",
+    "βₓ,ₘₐₓ / m": "beta_x_max",
+    "βₓ,ₘᵢₙ / m": "beta_x_min",
+    "βₓ,ₘₑₐₙ / m": "beta_x_mean",
+    "βᵧ,ₘₐₓ / m": "beta_y_max",
+    "βᵧ,ₘᵢₙ / m": "beta_y_min",
+    "βᵧ,ₘₑₐₙ / m": "beta_y_mean",
+    "ηₓ,ₘₐₓ / m": "eta_x_max",
+    "ηᵧ,ₘₐₓ / m": "eta_y_max",
+    "Mom. compaction": "momentum_compaction",
+    "Emittance": "emittance_x",
+    "I₁": "i1",
+    "I₂": "i2",
+    "I₃": "i3",
+    "I₄": "i4",
+    "I₅": "i5",
+    # elegant
+    "Natural Emittance / rad m": "emittance_x",
+    "U₀ / Mev": "energy_loss_per_turn",
+    "ɑ": "momentum_compaction",
+    "ɑ₂": "momentum_compaction_2",
+    "Jᵟ": "damping_partition_delta",
+    "τᵟ": "damping_time_delta",
+    "dQₓ / dδ": "chromaticity_x",
+    "d²Qₓ / dδ²": "chromaticity_x_2",
+    "d³Qₓ / dδ³": "chromaticity_x_3",
+    "dQᵧ / dδ": "chromaticity_y",
+    "d²Qᵧ / dδ²": "chromaticity_y_2",
+    "d³Qᵧ / dδ³": "chromaticity_y_3",
+    "Jₓ": "damping_partition_x",
+    "Jᵧ": "damping_partition_y",
+    "τₓ / s": "damping_time_x",
+    "τᵧ / s": "damping_time_y",
+    # madx
+    "Energy": "energy",
+    "transition energy": "gamma_transition",
+    "tune x": "tune_x",
+    "Tune y": "tune_y",
+    "chromaticity x": "chromaticity_x",
+    "Chromaticity y": "chromaticity_y",
+    "max beta x": "beta_x_max",
+    "max beta y": "beta_y_max",
+    "max eta x": "eta_x_max",
+    "max eta y": "eta_y_max",
+    "I1": "i1",
+    "I2": "i2",
+    "I3": "i3",
+    "I4": "i4",
+    "I5": "i5",
+}
+
+# labels with the element type, e.g. "Number of Dipole elements"
+metric_patterns = [
+    (re.compile(r"Number of (\w+) elements"), "n_{}"),
+    (re.compile(r"(\w+) length fraction"), "{}_length_fraction"),
+]
+
+schema = """
+CREATE TABLE IF NOT EXISTS lattices (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (namespace, name)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sources (
+    lattice_id INTEGER NOT NULL REFERENCES lattices (id),
+    code TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (lattice_id, code)
+);
+CREATE TABLE IF NOT EXISTS metric_values (
+    lattice_id INTEGER NOT NULL REFERENCES lattices (id),
+    metric_id INTEGER NOT NULL REFERENCES metrics (id),
+    code TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (lattice_id, metric_id, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metric_values_by_value ON metric_values (metric_id, value);
+"""
+
+condition_pattern = re.compile(
+    r"^\s*(?:(\w+)\.)?(\w+)\s*(<=|>=|==|!=|<|>|=)\s*(\S+)\s*$"
+)
+
+
+def metric_key(label) -> str:
+    "Returns the shared key of a label of the summary tables"
+    if label in metric_keys:
+        return metric_keys[label]
+    for pattern, key in metric_patterns:
+        match = pattern.fullmatch(label)
+        if match:
+            return key.format(match[1].lower())
+    return re.sub(r"\W+", "_", label.lower()).strip("_")
+
+
+def connect(path: Path = None) -> sqlite3.Connection:
+    path = Path(path or db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript(schema)
+    return connection
+
+
+def build(path: Path, sources: dict):
+    """doit action: load the metrics of the tables files `sources` into the database.
+
+    `sources` is a dict of namespace -> lattice name -> code -> path of the tables.
+    Lattices which are not in `sources` any more are removed.
+    """
+    connection = connect(path)
+    metric_ids = dict(connection.execute("SELECT key, id FROM metrics"))
+    with connection:
+        lattice_ids = {}
+        for namespace, lattices in sources.items():
+            for name, paths in lattices.items():
+                lattice_ids[(namespace, name)] = lattice_id = _lattice_id(
+                    connection, namespace, name
+                )
+                for code, tables_path in paths.items():
+                    _load(connection, metric_ids, lattice_id, code, Path(tables_path))
+                _remove(connection, lattice_id, exclude=list(paths))
+        for lattice_id, namespace, name in connection.execute(
+            "SELECT id, namespace, name FROM lattices"
+        ).fetchall():
+            if (namespace, name) not in lattice_ids:
+                _remove(connection, lattice_id)
+                connection.execute("DELETE FROM lattices WHERE id = ?", (lattice_id,))
+    connection.close()
+
+
+def _lattice_id(connection, namespace, name) -> int:
+    connection.execute(
+        "INSERT OR IGNORE INTO lattices (namespace, name) VALUES (?, ?)",
+        (namespace, name),
+    )
+    return connection.execute(
+        "SELECT id FROM lattices WHERE namespace = ? AND name = ?", (namespace, name)
+    ).fetchone()[0]
+
+
+def _load(connection, metric_ids, lattice_id, code, tables_path: Path):
+    "Load the tables file of a lattice and code, unless it is unchanged"
+    stat = tables_path.stat()
+    stamp = stat.st_mtime_ns, stat.st_size
+    previous = connection.execute(
+        "SELECT mtime_ns, size FROM sources WHERE lattice_id = ? AND code = ?",
+        (lattice_id, code),
+    ).fetchone()
+    if previous == stamp:
+        return
+    values = tables.values(json.loads(tables_path.read_text()))
+    connection.execute(
+        "DELETE FROM metric_values WHERE lattice_id = ? AND code = ?",
+        (lattice_id, code),
+    )
+    connection.executemany(
+        "INSERT OR REPLACE INTO metric_values VALUES (?, ?, ?, ?)",
+        [
+            (lattice_id, _metric_id(connection, metric_ids, label), code, value)
+            for label, value in values.items()
+        ],
+    )
+    connection.execute(
+        "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (lattice_id, code, *stamp)
+    )
+
+
+def _metric_id(connection, metric_ids, label) -> int:
+    key = metric_key(label)
+    if key not in metric_ids:
+        cursor = connection.execute("INSERT INTO metrics (key) VALUES (?)", (key,))
+        metric_ids[key] = cursor.lastrowid
+    return metric_ids[key]
+
+
+def _remove(connection, lattice_id, exclude=()):
+    "Delete the metrics of a lattice, except of the codes in `exclude`"
+    placeholders = ", ".join("?" * len(exclude))
+    for table in ("metric_values", "sources"):
+        connection.execute(
+            f"DELETE FROM {table} WHERE lattice_id = ? AND code NOT IN ({placeholders})",
+            (lattice_id, *exclude),
+        )
+
+
+def query(conditions, show=(), path=None) -> list:
+    """Returns the lattices which fulfil all `conditions`, e.g. "emittance_x < 1e-9"
+    or "madx.tune_x > 2" for the value of one code only, otherwise of any code.
+
+    The result is a list of dicts with the namespace, the name and the values of
+    the keys of the conditions and of `show` as key -> code -> value.
+    """
+    connection = connect(path)
+    metric_ids = dict(connection.execute("SELECT key, id FROM metrics"))
+    clauses, parameters, keys = [], [], list(show)
+    for condition in conditions:
+        match = condition_pattern.match(condition)
+        if match is None:
+            raise ValueError(f"Invalid condition {condition!r}, e.g. 'tune_x < 2'")
+        code, key, op, value = match.groups()
+        keys.append(key)
+        clause = "SELECT lattice_id FROM metric_values WHERE metric_id = ?"
+        clause += f" AND value {'=' if op == '==' else op} ?"
+        parameters += [metric_ids.get(key, -1), float(value)]
+        if code is not None:
+            clause += " AND code = ?"
+            parameters.append(code)
+        clauses.append(f"id IN ({clause})")
+
+    where = " AND ".join(clauses) or "1"
+    rows = connection.execute(
+        f"SELECT id, namespace, name FROM lattices WHERE {where} "
+        "ORDER BY namespace, name",
+        parameters,
+    ).fetchall()
+    results = {
+        lattice_id: {"namespace": namespace, "name": name, "metrics": {}}
+        for lattice_id, namespace, name in rows
+    }
+    wanted = [metric_ids[key] for key in dict.fromkeys(keys) if key in metric_ids]
+    if results and wanted:
+        for lattice_id, key, code, value in connection.execute(
+            "SELECT lattice_id, key, code, value FROM metric_values "
+            "JOIN metrics ON metrics.id = metric_id "
+            f"WHERE metric_id IN ({', '.join('?' * len(wanted))}) "
+            f"AND lattice_id IN (SELECT id FROM lattices WHERE {where})",
+            [*wanted, *parameters],
+        ):
+            results[lattice_id]["metrics"].setdefault(key, {})[code] = value
+    connection.close()
+    return list(results.values())
+
+
+def keys(path=None) -> list:
+    "Returns the keys of all metrics in the database"
+    connection = connect(path)
+    result = [
+        key for key, in connection.execute("SELECT key FROM metrics ORDER BY key")
+    ]
+    connection.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["query", "keys"])
+    parser.add_argument("conditions", nargs="*", help='e.g. "emittance_x < 1e-9"')
+    parser.add_argument("--show", nargs="*", default=[], help="keys to show")
+    parser.add_argument("--db", type=Path, help="path of the database")
+    args = parser.parse_args()
+
+    if args.command == "keys":
+        print("\n".join(keys(args.db)))
+        return
+    results = query(args.conditions, args.show, args.db)
+    for result in results:
+        values = ", ".join(
+            f"{key} {code}={value:.6g}"
+            for key, codes in result["metrics"].items()
+            for code, value in codes.items()
+        )
+        print(f"{result['namespace']}/{result['name']}  {values}")
+    print(f"{len(results)} lattices")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Export of the optics arrays of a simulation on a schema shared by all codes.
+
+The columns are stored as the uncompressed members of a numpy `.npz` file, so
+`load` can memory-map them and only touches the pages of the requested columns.
+Columns a code does not compute are left out.
+"""
+
+import struct
+import zipfile
+from pathlib import Path
+
+target = "optics.npz"
+
+# column name -> unit
+schema = {
+    "s": "m",
+    "beta_x": "m",
+    "alpha_x": "1",
+    "psi_x": "rad",
+    "eta_x": "m",
+    "eta_px": "1",
+    "beta_y": "m",
+    "alpha_y": "1",
+    "psi_y": "rad",
+    "eta_y": "m",
+    "eta_py": "1",
+}
+
+
+def save(path: Path, columns: dict):
+    "Write the optics `columns` (a subset of `schema`) to `path`"
+    import numpy as np
+
+    unknown = columns.keys() - schema.keys()
+    if unknown:
+        raise ValueError(f"Columns not in the optics schema: {sorted(unknown)}")
+    arrays = {
+        name: np.ascontiguousarray(columns[name], "<f8")
+        for name in schema
+        if name in columns
+    }
+    if len({array.shape for array in arrays.values()}) > 1:
+        raise ValueError("All optics columns must have the same length")
+    np.savez(path, **arrays)
+
+
+def load(path: Path, columns=None) -> dict:
+    "Returns the requested columns (default: all) as read-only memory-maps"
+    import numpy as np
+
+    result = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")]
+            if columns is not None and name not in columns:
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: column {name} is compressed")
+            # the member data starts after the local file header
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            if np.lib.format.read_magic(file) == (1, 0):
+                header = np.lib.format.read_array_header_1_0(file)
+            else:
+                header = np.lib.format.read_array_header_2_0(file)
+            shape, fortran_order, dtype = header
+            result[name] = np.memmap(
+                path,
+                dtype,
+                "r",
+                file.tell(),
+                shape,
+                "F" if fortran_order else "C",
+            )
+    return result
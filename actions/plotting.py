@@ -0,0 +1,149 @@
+"""Decimation of optics curves and rendering of the plots.
+
+The optics are sampled much finer than a plot can show. Before plotting, the
+curves are cropped to the visible range and reduced to the minimum and maximum of
+every pixel column, which keeps all peaks but only a few thousand points.
+
+The plot functions build a `Figure` directly instead of using pyplot, so the
+figures are not kept in pyplot's registry, and `render` releases them.
+Matplotlib is only imported by `new_figure`, which also configures it, so
+importing the action modules for their targets stays cheap.
+"""
+
+import inspect
+import json
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from . import FIG_SIZE, PLOT_DPI, PLOT_REPORT
+from .timing import span
+
+FONT = "Inter"
+
+# one bucket per pixel column of the figure
+BUDGET = int(FIG_SIZE[0] * PLOT_DPI)
+
+
+def configure():
+    """Set the matplotlib defaults of the plots.
+
+    Cheap enough for every figure, so it also holds inside an `rc_context` which
+    restores the previous defaults at its end. `FONT` is only used if matplotlib
+    finds it, otherwise every text would look for it again and warn before
+    falling back to the default font.
+    """
+    from matplotlib import rcParams
+
+    rcParams["savefig.dpi"] = PLOT_DPI
+    rcParams["font.family"] = "sans-serif"
+    fonts = [name for name in rcParams["font.sans-serif"] if name != FONT]
+    rcParams["font.sans-serif"] = [FONT, *fonts] if font_available(FONT) else fonts
+
+
+@lru_cache(maxsize=None)
+def font_available(name) -> bool:
+    "Returns True if matplotlib finds the font `name`, once per process"
+    from matplotlib import font_manager
+
+    try:
+        font_manager.findfont(name, fallback_to_default=False)
+    except ValueError:
+        return False
+    return True
+
+
+def new_figure():
+    "Returns a new `Figure` of size `FIG_SIZE`, not registered with pyplot"
+    from matplotlib.figure import Figure
+
+    configure()
+    return Figure(figsize=FIG_SIZE)
+
+
+def decimate(x, *curves, budget=BUDGET, x_range=None):
+    """Reduce curves sharing the sorted positions `x` to min/max per bucket.
+
+    Returns the decimated `x` and curves. Points outside of `x_range` are dropped,
+    except the neighbours needed to draw the lines up to the edges.
+    """
+    import numpy as np
+
+    x = np.asarray(x)
+    curves = [np.asarray(curve) for curve in curves]
+    if x_range is not None:
+        start = max(np.searchsorted(x, x_range[0], "right") - 1, 0)
+        stop = np.searchsorted(x, x_range[1], "left") + 1
+        x, curves = x[start:stop], [curve[start:stop] for curve in curves]
+    if budget is None or len(x) <= 2 * budget:
+        return (x, *curves)
+
+    edges = np.linspace(x[0], x[-1], budget + 1)
+    bounds = np.searchsorted(x, edges[1:-1])
+    keep = {0, len(x) - 1}
+    for start, stop in zip([0, *bounds], [*bounds, len(x)]):
+        if start == stop:
+            continue
+        for curve in curves:
+            keep.add(start + int(np.argmin(curve[start:stop])))
+            keep.add(start + int(np.argmax(curve[start:stop])))
+    indices = np.fromiter(sorted(keep), dtype=np.intp)
+    return (x[indices], *(curve[indices] for curve in curves))
+
+
+def render(path: Path, plot, *args, report=None):
+    """Save the figure returned by `plot(*args)` to `path`.
+
+    With a `report` dict, plots which decimate (take a `budget`) are rendered at
+    full resolution as well and the saved bytes and render time are recorded.
+    """
+    start = time.perf_counter()
+    with span(f"plot {path.stem}"):
+        with span("figure"):
+            fig = plot(*args)
+        with span("savefig"), released(fig):
+            fig.savefig(path)
+    elapsed = time.perf_counter() - start
+
+    if report is None or "budget" not in inspect.signature(plot).parameters:
+        return
+    buffer = BytesIO()
+    start = time.perf_counter()
+    with released(plot(*args, budget=None)) as fig:
+        fig.savefig(buffer, format=path.suffix[1:])
+    report[path.name] = {
+        "bytes": path.stat().st_size,
+        "bytes_full": buffer.tell(),
+        "render_time": elapsed,
+        "render_time_full": time.perf_counter() - start,
+    }
+
+
+@contextmanager
+def released(fig):
+    "Release the memory of `fig` when the block ends, also if it is a pyplot figure"
+    try:
+        yield fig
+    finally:
+        pyplot = sys.modules.get("matplotlib.pyplot")
+        if pyplot is not None:  # otherwise there are no pyplot figures
+            pyplot.close(fig)
+        fig.clear()
+
+
+def save_report(report, output_dir: Path):
+    "Write the report of `render` to the output dir and print a summary"
+    if not report:
+        return
+    (output_dir / "plot_report.json").write_text(json.dumps(report, indent=2))
+    saved_bytes = sum(r["bytes_full"] - r["bytes"] for r in report.values())
+    saved_time = sum(r["render_time_full"] - r["render_time"] for r in report.values())
+    print(f"Decimation saved {saved_bytes / 1024:.0f} KiB and {saved_time:.2f} s 📉")
+
+
+def new_report():
+    "Returns an empty report if enabled by `PLOT_REPORT`, otherwise None"
+    return {} if PLOT_REPORT else None
@@ -0,0 +1,165 @@
+"""Pool of long-lived worker processes with the heavy modules already imported.
+
+In the default mode every process running an action pays for importing
+matplotlib, numpy and the simulation codes. The warm pool pays this once per
+worker and reports the measured task and import times when the run finishes,
+and the import time it saved: the cold start of every task, measured once per
+action module in a fresh interpreter, minus the warm up of the workers.
+In processes started by doit (`-P process`) the actions run inline instead, so
+the parallel doit processes do not start a pool each.
+"""
+
+import atexit
+import importlib
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from threading import Lock
+
+from . import base_dir
+
+heavy_modules = [
+    "numpy",
+    "matplotlib.pyplot",
+    "latticejson",
+    "apace",
+    "cpymad.madx",
+    "eleganttools",
+    "actions.lattice_info",
+    "actions.twiss_apace",
+    "actions.twiss_elegant",
+    "actions.twiss_madx",
+]
+
+_executor = None
+_lock = Lock()
+_stats = {"tasks": 0, "task_time": 0.0, "warm_up_times": {}, "modules": Counter()}
+_warm_up_time = 0.0
+
+
+def _warm_up():
+    "Import the heavy modules once when a worker process starts"
+    global _warm_up_time
+    start = time.perf_counter()
+    for name in heavy_modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    from .plotting import FONT, font_available
+
+    font_available(FONT)
+    _warm_up_time = time.perf_counter() - start
+
+
+def _execute(module_name, function_name, args):
+    "Run a function inside a worker with isolated matplotlib state"
+    import matplotlib.pyplot as plt
+    from matplotlib import rc_context
+
+    from .plotting import configure
+
+    function = getattr(importlib.import_module(module_name), function_name)
+    start = time.perf_counter()
+    try:
+        with rc_context():
+            configure()
+            result = function(*args)
+    finally:
+        plt.close("all")
+    return result, time.perf_counter() - start, _warm_up_time, os.getpid()
+
+
+def executor():
+    "Returns the worker pool, starting one worker per core on first use"
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+            atexit.register(shutdown)
+    return _executor
+
+
+def run(module_name, function_name, args):
+    "Run `module_name.function_name(*args)` in a warm worker and wait for it"
+    if multiprocessing.parent_process() is not None:
+        return _execute(module_name, function_name, args)[0]
+    future = executor().submit(_execute, module_name, function_name, args)
+    result, task_time, warm_up_time, pid = future.result()
+    with _lock:
+        _stats["tasks"] += 1
+        _stats["task_time"] += task_time
+        _stats["warm_up_times"][pid] = warm_up_time
+        _stats["modules"][module_name] += 1
+    return result
+
+
+@lru_cache(maxsize=None)
+def cold_start(module_name) -> float:
+    """Returns the time a fresh process takes to import matplotlib and the module of
+    an action, 0 if the import fails.
+    """
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import matplotlib.pyplot, {module_name}; "
+        "print(time.perf_counter() - start)"
+    )
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=base_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except subprocess.CalledProcessError:
+        return 0.0
+    return float(output)
+
+
+def report():
+    "Returns the measured times of the work done by the pool and the time it saved"
+    warm_up_times = list(_stats["warm_up_times"].values())
+    n_workers = len(warm_up_times)
+    cold_start_time = sum(
+        n_tasks * cold_start(module_name)
+        for module_name, n_tasks in _stats["modules"].items()
+    )
+    return {
+        "tasks": _stats["tasks"],
+        "workers": n_workers,
+        "task_time": _stats["task_time"],
+        "warm_up_per_process": sum(warm_up_times) / n_workers if n_workers else 0.0,
+        "cold_start_time": cold_start_time,
+        "saved_time": cold_start_time - sum(warm_up_times),
+    }
+
+
+def shutdown():
+    "Stop the workers and print the report"
+    global _executor
+    with _lock:
+        if _executor is None:
+            return
+        _executor.shutdown()
+        _executor = None
+    stats = report()
+    if stats["tasks"] > 0:
+        print(
+            f"Warm worker pool: {stats['tasks']} tasks on {stats['workers']} workers, "
+            f"{stats['task_time']:.2f} s in tasks, "
+            f"{stats['warm_up_per_process']:.2f} s import/setup per process, "
+            f"{stats['saved_time']:.2f} s saved compared with "
+            f"{stats['cold_start_time']:.2f} s of cold starts ⏱",
+            # doit may still capture sys.stdout when the interpreter exits
+            file=sys.__stdout__,
+        )
@@ -0,0 +1,103 @@
+"""Background rendering of the plots while doit continues with the next tasks.
+
+With `RENDER_POOL` enabled in config.toml, the plots tasks only submit their
+action to a pool of render processes and return, so doit starts the next
+simulation right away. The run waits for the renders when it completes. If a
+render fails its targets are removed, so the plots task runs again next time.
+The render processes use the non-interactive Agg backend, and the figures are
+released after every render, so their memory stays flat.
+"""
+
+import atexit
+import multiprocessing
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+from . import config, pool
+
+max_workers = int(config.get("RENDER_WORKERS", 0)) or max(os.cpu_count() // 2, 1)
+
+_executor = None
+_lock = Lock()
+_pending = {}  # task name -> (future, targets)
+errors = {}  # task name -> error of the failed renders waited for
+
+
+def _warm_up():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    pool._warm_up()
+
+
+def _execute(action):
+    "Run the doit `action` with isolated matplotlib state"
+    import matplotlib.pyplot as plt
+    from matplotlib import rc_context
+
+    from .plotting import configure
+
+    function, args, *kwargs = action
+    try:
+        with rc_context():
+            configure()
+            result = function(*args, **(kwargs[0] if kwargs else {}))
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        plt.close("all")
+    return "action failed" if result is False else None
+
+
+def executor():
+    "Returns the render pool, starting it on first use"
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+            atexit.register(wait)
+    return _executor
+
+
+def submit(task_name, action, targets):
+    "doit action: render the doit `action` of `task_name` in the background"
+    if multiprocessing.parent_process() is not None:
+        # doit runs tasks in processes (-P process), which exit without waiting
+        error = _execute(action)
+        if error is not None:
+            print(error)
+        return error is None
+    future = executor().submit(_execute, action)
+    with _lock:
+        _pending[task_name] = future, [Path(target) for target in targets]
+    print("Rendering plots in the background 🖌")
+
+
+def wait() -> dict:
+    """Wait for all submitted renders, returns the errors by task name.
+
+    The errors are also added to `errors`.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    failed = {}
+    for task_name, (future, targets) in pending.items():
+        try:
+            error = future.result()
+        except Exception as exception:  # e.g. the render process died
+            error = repr(exception)
+        if error is None:
+            continue
+        failed[task_name] = error
+        for target in targets:
+            target.unlink(missing_ok=True)
+    errors.update(failed)
+    return failed
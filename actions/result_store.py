@@ -0,0 +1,154 @@
+"""Content-addressed store of task outputs, shared across checkouts and machines.
+
+An entry is keyed by the hash of the content of the input files of a task and of
+the values which determine its outputs (code fingerprint, energy, profile, tool
+versions), but not by any path. So identical lattices in different namespaces
+and fresh checkouts reuse the outputs of an earlier run, which are copied into
+place. The store is a plain directory (`RESULT_STORE` in config.toml), a
+shared filesystem or a synced copy of it can act as remote. Entries which were
+not used for `MAX_AGE` seconds are evicted, after that the least recently used
+entries until the store is smaller than `MAX_SIZE` bytes. The store is pruned at
+the end of a run, at most every `PRUNE_INTERVAL` seconds, as every prune stats
+all entries.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+
+from . import base_dir, config
+from .lattice_cache import content_hash
+
+# disabled by an empty RESULT_STORE
+enabled = bool(str(config.get("RESULT_STORE", "_cache/results")))
+store_dir = base_dir / str(config.get("RESULT_STORE", "_cache/results"))
+
+MAX_SIZE = 2 * 1024 * 1024 * 1024
+MAX_AGE = 90 * 24 * 60 * 60
+PRUNE_INTERVAL = 60 * 60
+
+
+def run(action, inputs, values, targets):
+    """doit action: copy the `targets` from the store or run the doit `action`.
+
+    The outputs of a successful run are added to the store.
+    """
+    key = entry_key(inputs, values)
+    targets = [Path(target) for target in targets]
+    if fetch(key, targets):
+        print("Reusing stored results ♻")
+        return True
+
+    function, args, *kwargs = action
+    result = function(*args, **(kwargs[0] if kwargs else {}))
+    if result is not False and all(target.exists() for target in targets):
+        store(key, targets)
+    return result
+
+
+def entry_key(inputs, values) -> str:
+    "Returns the key of the input files and values"
+    data = {
+        "inputs": [content_hash(path) for path in inputs],
+        "values": values,
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def entry_dir(key):
+    return store_dir / key[:2] / key[2:]
+
+
+def fetch(key, targets) -> bool:
+    "Copy the stored outputs to `targets`, returns False if there is no entry"
+    entry = entry_dir(key)
+    stored = [entry / f"{i}{target.suffix}" for i, target in enumerate(targets)]
+    if not all(path.exists() for path in stored):
+        return False
+    for path, target in zip(stored, targets):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)  # may be read-only
+        shutil.copyfile(path, target)
+    os.utime(entry)  # the modification time marks the last use
+    return True
+
+
+def store(key, targets):
+    """Add copies of the files `targets` as the entry `key`, concurrent stores are
+    fine. The copies are read-only, the targets stay writable.
+    """
+    entry = entry_dir(key)
+    if entry.exists():
+        return
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=entry.parent, prefix=".tmp-"))
+    for i, target in enumerate(targets):
+        path = tmp / f"{i}{target.suffix}"
+        shutil.copyfile(target, path)
+        path.chmod(0o444)
+    try:
+        tmp.rename(entry)
+    except OSError:
+        shutil.rmtree(tmp)  # stored by another process in the meantime
+
+
+def prune(max_size=MAX_SIZE, max_age=MAX_AGE, interval=0):
+    """Evict entries older than `max_age` and the oldest until below `max_size`.
+
+    Nothing is done if any process pruned the store less than `interval` s ago.
+    """
+    if not enabled or not store_dir.is_dir():
+        return
+    now = time.time()
+    stamp = store_dir / ".pruned"
+    try:
+        if now - stamp.stat().st_mtime < interval:
+            return
+    except FileNotFoundError:
+        pass
+    stamp.touch()
+    entries = []
+    for entry in store_dir.glob("??/*"):
+        try:
+            mtime = entry.stat().st_mtime
+            size = sum(path.stat().st_size for path in entry.iterdir())
+        except FileNotFoundError:
+            continue  # removed by a concurrent process
+        if entry.name.startswith(".tmp-"):
+            continue  # being stored
+        if now - mtime > max_age:
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entries.append((mtime, size, entry))
+
+    size = sum(size for _, size, _ in entries)
+    for _, entry_size, entry in sorted(entries):
+        if size <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        size -= entry_size
+
+
+@lru_cache(maxsize=None)
+def versions(*distributions) -> dict:
+    "Returns the installed versions of the Python packages `distributions`"
+    result = {}
+    for distribution in distributions:
+        try:
+            result[distribution] = metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            result[distribution] = None
+    return result
+
+
+@lru_cache(maxsize=None)
+def executable_version(executable) -> str:
+    "Returns the hash of an executable like elegant as its version"
+    path = shutil.which(executable)
+    return content_hash(path) if path else executable
@@ -0,0 +1,88 @@
+"""Parameter scans of a lattice declared in its info.toml entry, e.g.
+
+    [fodo]
+    energy = 1700
+    simulations = ["madx"]
+    scan = { energy = [1700, 1800], "Q1.k1" = [1.1, 1.2, 1.3] }
+
+The scan grid is the product of all parameter values. The points are spread in
+contiguous chunks over a pool of processes, each of which loads the lattice once
+into the `ScanModel` of the simulation code and between two points only updates
+the parameters which changed. The result is one table of the metrics of the
+summary tables over the scan grid.
+"""
+
+import importlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import tables
+
+codes = {"apace": "actions.twiss_apace", "madx": "actions.twiss_madx"}
+target = "scan.json"
+
+# state of a scan process: the model and the current values of the parameters
+_model = None
+_current = {}
+
+
+def grid(scan: dict):
+    "Returns the parameter names and the points of the scan grid"
+    names = list(scan)
+    return names, list(itertools.product(*(scan[name] for name in names)))
+
+
+def action(code, lattice, lattice_path: Path, output_dir: Path):
+    "Run the scan of `lattice` with the simulation `code` and write the table"
+    names, points = grid(lattice["scan"])
+    n_workers = min(len(points), os.cpu_count())
+    print(f"Scanning {len(points)} points on {n_workers} processes 🔭")
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load,
+        initargs=(code, lattice, lattice_path),
+    ) as executor:
+        chunksize = math.ceil(len(points) / n_workers)
+        changes = ([*zip(names, point)] for point in points)
+        results = list(executor.map(_evaluate, changes, chunksize=chunksize))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / target).write_text(json.dumps(table(names, points, results)))
+
+
+def table(names, points, results) -> dict:
+    "Returns the column-oriented table of the metrics over the scan grid"
+    metrics = {}
+    for i, (values, _) in enumerate(results):
+        for metric, value in values.items():
+            metrics.setdefault(metric, [None] * len(points))[i] = value
+    return {
+        "parameters": names,
+        "points": [list(point) for point in points],
+        "metrics": metrics,
+        "errors": {i: error for i, (_, error) in enumerate(results) if error},
+    }
+
+
+def _load(code, lattice, lattice_path):
+    global _model
+    _model = importlib.import_module(codes[code]).ScanModel(lattice, lattice_path)
+
+
+def _evaluate(changes):
+    "Returns the metrics at the point of the scan and an error message or None"
+    try:
+        for name, value in changes:
+            if _current.get(name) != value:
+                _model.update(name, value)
+                _current[name] = value
+        return tables.values(_model.tables()), None
+    except Exception as exception:  # e.g. no stable optics at this point
+        _current.clear()  # the update may be incomplete
+        return {}, repr(exception)
@@ -0,0 +1,134 @@
+"""Scheduler for external simulation processes like elegant.
+
+The number of concurrent runs is bounded across all doit processes by lock files,
+one per slot, and every slot pins its process to its own share of the CPUs (by
+`taskset`, so the process starts pinned). Each run has a timeout and is retried
+on failure. Its stdout/stderr are captured in a log file and its runtime and
+peak RSS are recorded in a json file next to it. The peak RSS is sampled from
+`/proc/<pid>/status` while the process runs, as the `ru_maxrss` of a forked
+child includes the memory of the parent at the time of the fork.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import signal
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import simulation_dir, timing
+
+slots_dir = simulation_dir / "slots"
+
+
+def run(command, log_path: Path, concurrency=0, timeout=None, retries=0):
+    """Run `command` in a free slot, returns True on success (doit convention).
+
+    `concurrency` is the maximum number of simultaneous runs (0: one per CPU).
+    """
+    available = sorted(os.sched_getaffinity(0))
+    concurrency = concurrency or len(available)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with slot(concurrency) as index, log_path.open("w") as log:
+        cpus = slot_cpus(available, index, concurrency)
+        for attempt in range(1, retries + 2):
+            log.write(f"# attempt {attempt}: {' '.join(map(str, command))}\n")
+            log.flush()
+            record = _run_once(command, log, timeout, cpus)
+            if record["returncode"] == 0:
+                break
+
+    record.update(command=list(map(str, command)), attempts=attempt, slot=index)
+    log_path.with_suffix(".run.json").write_text(json.dumps(record, indent=2))
+    timing.record(
+        Path(command[0]).name, record["runtime"], record["cpu_time"], record["peak_rss"]
+    )
+    return record["returncode"] == 0
+
+
+@contextmanager
+def slot(concurrency):
+    "Wait for one of `concurrency` slots to be free and yield its index"
+    slots_dir.mkdir(parents=True, exist_ok=True)
+    while True:
+        for index in range(concurrency):
+            file = (slots_dir / f"{index}.lock").open("w")
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                continue
+            try:
+                yield index
+            finally:
+                file.close()  # also releases the lock
+            return
+        time.sleep(0.1)
+
+
+def slot_cpus(available, index, concurrency):
+    "Returns the CPUs for a slot, the available CPUs are split evenly"
+    n = max(len(available) // concurrency, 1)
+    start = index * n % len(available)
+    return available[start : start + n]
+
+
+def _run_once(command, log, timeout, cpus):
+    taskset = shutil.which("taskset")
+    if taskset:
+        # pinned before exec so that no thread of the child starts unpinned
+        command = [taskset, "-c", ",".join(map(str, cpus)), *command]
+    start = time.perf_counter()
+    # own session to be able to kill the whole process group on timeout
+    process = subprocess.Popen(
+        command, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+    )
+    if not taskset:
+        os.sched_setaffinity(process.pid, cpus)
+    timed_out, peak_rss = False, 0
+    try:
+        while True:
+            peak_rss = _peak_rss(process.pid, peak_rss)
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            if timeout is not None and time.perf_counter() - start > timeout:
+                os.killpg(process.pid, signal.SIGKILL)
+                pid, status, rusage = os.wait4(process.pid, 0)
+                timed_out = True
+                break
+            time.sleep(0.05)
+    except BaseException:  # e.g. a work queue worker lost the lease of the task
+        os.killpg(process.pid, signal.SIGKILL)
+        os.wait4(process.pid, 0)
+        raise
+
+    if os.WIFEXITED(status):
+        process.returncode = os.WEXITSTATUS(status)
+    else:
+        process.returncode = -os.WTERMSIG(status)
+    if timed_out:
+        log.write(f"# killed after timeout of {timeout} s\n")
+    return {
+        "returncode": process.returncode,
+        "timed_out": timed_out,
+        "runtime": time.perf_counter() - start,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,
+        "peak_rss": peak_rss,
+        "cpus": cpus,
+    }
+
+
+def _peak_rss(pid, previous=0):
+    "Returns the peak RSS / bytes of the running process `pid`, at least `previous`"
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return max(previous, int(line.split()[1]) * 1024)
+    except FileNotFoundError:
+        pass
+    return previous  # exited (a zombie has no memory) or no /proc
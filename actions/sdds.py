@@ -0,0 +1,203 @@
+"""Column-selective reader for binary SDDS files like elegant's .twi output.
+
+Only the header is parsed, the data is memory-mapped and only the requested
+columns and parameters of the first page are returned. Numeric columns are
+zero-copy views into the file if the layout allows (column-major order, or
+row-major order without string columns), otherwise only the requested columns
+are gathered.
+"""
+
+import re
+import struct
+from pathlib import Path
+
+dtypes = {
+    "double": "f8",
+    "float": "f4",
+    "long64": "i8",
+    "ulong64": "u8",
+    "long": "i4",
+    "ulong": "u4",
+    "short": "i2",
+    "ushort": "u2",
+    "character": "S1",
+}
+
+_attribute = re.compile(r'(\w+)\s*=\s*("(?:[^"\\]|\\.)*"|[^,\s]*)')
+
+
+def read(path: Path, columns=None, parameters=None) -> dict:
+    """Returns a dict of the requested columns and parameters (default: all).
+
+    ASCII files are handed over to eleganttools.
+    """
+    import numpy as np
+
+    header, data_offset = parse_header(path)
+    if header["data"].get("mode", "binary") != "binary":
+        from eleganttools import SDDS
+
+        column_names = {column["name"] for column in header["columns"]}
+
+        def requested(name):
+            wanted = columns if name in column_names else parameters
+            return wanted is None or name in wanted
+
+        data = SDDS(path).as_dict()
+        return {name: value for name, value in data.items() if requested(name)}
+
+    byteorder = "<" if header["little_endian"] else ">"
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    result = {}
+    position = data_offset
+
+    def read_scalar(type_):
+        nonlocal position
+        if type_ == "string":
+            length = int(buffer[position : position + 4].view(f"{byteorder}i4")[0])
+            position += 4
+            value = bytes(buffer[position : position + length]).decode()
+            position += length
+            return value
+        dtype = np.dtype(byteorder + dtypes[type_])
+        value = buffer[position : position + dtype.itemsize].view(dtype)[0]
+        position += dtype.itemsize
+        return value.item()
+
+    n_rows = read_scalar("long")
+    if n_rows == -2147483648:  # large row counts are stored as long64
+        n_rows = read_scalar("long64")
+
+    for parameter in header["parameters"]:
+        name, type_ = parameter["name"], parameter["type"]
+        if "fixed_value" in parameter:
+            value = parameter["fixed_value"]
+            if type_ in ("double", "float"):
+                value = float(value)
+            elif type_ not in ("string", "character"):
+                value = int(value)
+        else:
+            value = read_scalar(type_)
+        if parameters is None or name in parameters:
+            result[name] = value
+
+    column_defs = header["columns"]
+    wanted = [c for c in column_defs if columns is None or c["name"] in columns]
+    has_strings = any(column["type"] == "string" for column in column_defs)
+    if header["data"].get("column_major_order", "0") == "1":
+        for column in column_defs:
+            name, type_ = column["name"], column["type"]
+            if type_ == "string":
+                values = [read_scalar("string") for _ in range(n_rows)]
+                array = np.array(values)
+            else:
+                dtype = np.dtype(byteorder + dtypes[type_])
+                array = np.frombuffer(buffer, dtype, n_rows, position)
+                position += n_rows * dtype.itemsize
+            if column in wanted:
+                result[name] = array
+    elif not has_strings:
+        row_dtype = np.dtype(
+            [(c["name"], byteorder + dtypes[c["type"]]) for c in column_defs]
+        )
+        rows = np.ndarray((n_rows,), row_dtype, buffer, position)
+        for column in wanted:
+            result[column["name"]] = rows[column["name"]]
+    else:
+        result.update(
+            _gather_rows(buffer, position, n_rows, column_defs, wanted, byteorder)
+        )
+    return result
+
+
+def _gather_rows(buffer, position, n_rows, column_defs, wanted, byteorder):
+    "Row-major data with strings: walk the string lengths, then gather columns"
+    import numpy as np
+
+    sizes = [
+        4 if c["type"] == "string" else np.dtype(dtypes[c["type"]]).itemsize
+        for c in column_defs
+    ]
+    string_indices = [i for i, c in enumerate(column_defs) if c["type"] == "string"]
+    # offset of every column within the row if all strings were empty
+    base_offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+    # fixed number of bytes between the length fields of consecutive strings
+    steps = np.diff([0, *(base_offsets[i] for i in string_indices)]).tolist()
+    row_rest = sum(sizes) - base_offsets[string_indices[-1]]
+    unpack_length = struct.Struct(f"{byteorder}i").unpack_from
+    memory = memoryview(buffer)
+
+    row_starts, lengths = [], []
+    for _ in range(n_rows):
+        row_starts.append(position)
+        for step in steps:
+            position += step
+            (length,) = unpack_length(memory, position)
+            lengths.append(length)
+            position += length
+        position += row_rest
+    row_starts = np.array(row_starts, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64).reshape(n_rows, len(steps))
+
+    result = {}
+    for column in wanted:
+        index = column_defs.index(column)
+        n_before = sum(i < index for i in string_indices)
+        offsets = row_starts + base_offsets[index] + lengths[:, :n_before].sum(axis=1)
+        if column["type"] == "string":
+            result[column["name"]] = np.array(
+                [
+                    memory[offset + 4 : offset + 4 + length].tobytes().decode()
+                    for offset, length in zip(
+                        offsets.tolist(), lengths[:, n_before].tolist()
+                    )
+                ]
+            )
+        else:
+            dtype = np.dtype(byteorder + dtypes[column["type"]])
+            indices = offsets[:, None] + np.arange(dtype.itemsize)
+            result[column["name"]] = buffer[indices].view(dtype).ravel()
+    return result
+
+
+def parse_header(path: Path):
+    "Returns the parsed header of an SDDS file and the offset of its data"
+    header = {
+        "parameters": [],
+        "columns": [],
+        "data": {},
+        "little_endian": True,
+    }
+    with open(path, "rb") as file:
+        if not file.readline().startswith(b"SDDS"):
+            raise ValueError(f"{path} is not an SDDS file")
+        text = ""
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"{path} has no &data section")
+            line = line.decode(errors="replace")
+            if line.startswith("!"):
+                if "big-endian" in line:
+                    header["little_endian"] = False
+                continue
+            text += line
+            if "&end" not in text:
+                continue  # namelist continues on the next line
+            kind, _, body = text.strip().partition(" ")
+            text = ""
+            attributes = {
+                key: value.strip('"') for key, value in _attribute.findall(body)
+            }
+            if kind == "&parameter":
+                header["parameters"].append(attributes)
+            elif kind == "&column":
+                header["columns"].append(attributes)
+            elif kind == "&array":
+                raise ValueError(
+                    f"{path} contains the SDDS array {attributes.get('name')!r}, "
+                    "arrays are not supported"
+                )
+            elif kind == "&data":
+                header["data"] = attributes
+                return header, file.tell()
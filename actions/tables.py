@@ -0,0 +1,28 @@
+from numbers import Real
+
+
+def values(tables) -> dict:
+    "Returns a flat dict of label -> value of all numeric rows in summary tables"
+    result = {}
+
+    def _collect(item):
+        if not isinstance(item, list):
+            return
+        if len(item) == 2 and isinstance(item[0], str) and isinstance(item[1], Real):
+            result[item[0]] = item[1]
+        else:
+            for child in item:
+                _collect(child)
+
+    _collect(tables)
+    return result
+
+
+def relative_deviations(reference, other) -> dict:
+    "Returns the relative deviation of all numeric rows present in both tables"
+    reference, other = values(reference), values(other)
+    return {
+        label: abs(other[label] - value) / abs(value) if value else abs(other[label])
+        for label, value in reference.items()
+        if label in other
+    }
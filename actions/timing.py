@@ -0,0 +1,204 @@
+"""Span-based instrumentation of the tasks and of the stages inside the actions.
+
+Every task runs inside a span and the actions open nested spans for their
+stages. A span records its wall time, CPU time and the peak RSS of the process
+while it was open: the peak (VmHWM) is reset through /proc/self/clear_refs when
+a span starts and folded into all open spans before every reset, so warm
+workers do not report the peak of an earlier task. Without /proc the peak RSS
+is left out. The records of a task are buffered and appended at its end to one
+file per process and run, at the end of the run `report` writes a
+`timings.json` per lattice and a report of the slowest lattices and stages.
+Tasks matching `PROFILE_TASKS` in config.toml run under cProfile.
+"""
+
+import cProfile
+import importlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from operator import itemgetter
+from pathlib import Path
+
+from . import base_dir, config
+
+timings_dir = base_dir / "_cache" / "timings"
+profile_patterns = [str(pattern) for pattern in config.get("PROFILE_TASKS", [])]
+
+# inherited by the worker processes, so all records of a run end up together
+os.environ.setdefault("TIMING_RUN", time.strftime("%Y%m%d-%H%M%S-") + str(os.getpid()))
+
+# task and open spans of the current thread, doit may run tasks in threads
+_current = threading.local()
+
+# peak RSS of the open spans of all threads, one-element lists
+_open_peaks = []
+_peaks_lock = threading.Lock()
+_status = Path("/proc/self/status")
+_clear_refs = Path("/proc/self/clear_refs")
+
+
+def task(task_name, module_name, function_name, args, kwargs=None):
+    "Run `module_name.function_name(*args)` as the task `task_name` inside a span"
+    function = getattr(importlib.import_module(module_name), function_name)
+    kwargs = kwargs or {}
+    _current.task, _current.spans, _current.entries = task_name, [], []
+    try:
+        with span("task"):
+            if any(fnmatch(task_name, pattern) for pattern in profile_patterns):
+                return _profiled(task_name, function, args, kwargs)
+            return function(*args, **kwargs)
+    finally:
+        _current.task = None
+        _write(_current.entries)
+
+
+@contextmanager
+def span(name):
+    "Record the wall time, CPU time and peak RSS of the enclosed stage"
+    if getattr(_current, "task", None) is None:
+        yield  # not inside a task, e.g. in tests
+        return
+    peak = _open_peak()
+    # CPU time of this thread, doit may run other tasks in parallel threads
+    wall, cpu = time.perf_counter(), time.thread_time()
+    _current.spans.append(name)
+    try:
+        yield
+    finally:
+        _current.spans.pop()
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        record(name, wall, cpu, _close_peak(peak))
+
+
+def record(name, wall, cpu, peak_rss=None):
+    "Add a span `name` below the open spans to the current task"
+    if getattr(_current, "task", None) is None:
+        return
+    path = "/".join([*_current.spans, name])
+    entry = {"task": _current.task, "span": path, "wall": wall, "cpu": cpu}
+    if peak_rss is not None:
+        entry["peak_rss"] = peak_rss
+    _current.entries.append(entry)
+
+
+def _vm_hwm():
+    "Returns the peak RSS of this process / bytes since the last reset, or None"
+    try:
+        for line in _status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _fold_peak():
+    "Fold the current peak RSS into all open spans, returns False without /proc"
+    peak = _vm_hwm()
+    if peak is None:
+        return False
+    for open_peak in _open_peaks:
+        open_peak[0] = max(open_peak[0], peak)
+    return True
+
+
+def _open_peak():
+    "Reset the peak RSS of the process and return the peak of a new span"
+    with _peaks_lock:
+        if not _fold_peak():
+            return None
+        try:
+            _clear_refs.write_text("5")  # resets VmHWM to the current RSS
+        except OSError:
+            return None  # the peak would be the one of the process lifetime
+        peak = [_vm_hwm()]
+        _open_peaks.append(peak)
+        return peak
+
+
+def _close_peak(peak):
+    "Returns the peak RSS of the span opened by `_open_peak`"
+    if peak is None:
+        return None
+    with _peaks_lock:
+        _fold_peak()
+        _open_peaks[:] = [p for p in _open_peaks if p is not peak]
+    return peak[0]
+
+
+def _write(entries):
+    "Append the spans of a task to the file of this process"
+    run_dir = timings_dir / "runs" / os.environ["TIMING_RUN"]
+    run_dir.mkdir(parents=True, exist_ok=True)
+    with (run_dir / f"{os.getpid()}.jsonl").open("a") as file:
+        file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+
+def _profiled(task_name, function, args, kwargs):
+    profile_dir = timings_dir / "profiles"
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        path = profile_dir / (task_name.replace("/", "-").replace(":", "-") + ".prof")
+        profile.dump_stats(path)
+        print(f"Profile written to {path} 🔍")
+
+
+def report(n_slowest=5):
+    """Write the timings of the current run per lattice and return a report of the
+    slowest lattices and stages, or None if nothing was recorded.
+    """
+    run_dir = timings_dir / "runs" / os.environ["TIMING_RUN"]
+    entries = [
+        json.loads(line)
+        for path in sorted(run_dir.glob("*.jsonl"))
+        for line in path.read_text().splitlines()
+    ]
+    if not entries:
+        return None
+
+    by_lattice = defaultdict(dict)
+    for entry in entries:
+        task_name, _, lattice = entry["task"].partition(":")
+        spans = by_lattice[lattice].setdefault(task_name, {})
+        spans[entry["span"]] = {
+            key: value for key, value in entry.items() if key not in ("task", "span")
+        }
+    for lattice, tasks in by_lattice.items():
+        path = timings_dir / lattice / "timings.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # keep the timings of tasks which were up-to-date in this run
+        previous = json.loads(path.read_text()) if path.exists() else {}
+        path.write_text(json.dumps({**previous, **tasks}, indent=2))
+
+    lattice_times = {
+        lattice: sum(spans["task"]["wall"] for spans in tasks.values())
+        for lattice, tasks in by_lattice.items()
+    }
+    # only the innermost spans, the outer ones contain their time
+    parents = {(entry["task"], entry["span"].rpartition("/")[0]) for entry in entries}
+    stage_times = defaultdict(float)
+    for entry in entries:
+        if (entry["task"], entry["span"]) in parents:
+            continue
+        task_name = entry["task"].partition(":")[0]
+        _, _, stage = entry["span"].partition("task/")
+        stage_times[f"{task_name} {stage}".strip()] += entry["wall"]
+    slowest = sorted(lattice_times.items(), key=itemgetter(1), reverse=True)
+    slowest_stages = sorted(stage_times.items(), key=itemgetter(1), reverse=True)
+    result = {
+        "run": os.environ["TIMING_RUN"],
+        "tasks": sum(entry["span"] == "task" for entry in entries),
+        "slowest_lattices": slowest[:n_slowest],
+        "slowest_stages": slowest_stages[:n_slowest],
+    }
+    (timings_dir / "report.json").write_text(json.dumps(result, indent=2))
+    shutil.rmtree(run_dir)
+    return result
@@ -1,38 +1,141 @@
 import json
+import pickle
 from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
-import apace as ap
-import matplotlib.pyplot as plt
-import numpy as np
+from . import PLOT_FORMAT, optics_export, simulation_dir
+from .lattice_cache import apace_lattice
+from .lattice_info import periodic_section
+from .plotting import BUDGET, decimate, new_figure, new_report, render, save_report
+from .tables import relative_deviations
+from .timing import span
 
-from . import FIG_SIZE
+if TYPE_CHECKING:
+    import apace as ap
+
+simulation_apace_dir = simulation_dir / "apace"
+simulation_apace_dir.mkdir(exist_ok=True)
 
 targets = [
     "twiss_tables.json",
-    "twiss.svg",
-    "floor_plan.svg",
+    f"twiss.{PLOT_FORMAT}",
+    f"floor_plan.{PLOT_FORMAT}",
+    optics_export.target,
 ]
+table_targets = [targets[0], targets[3]]
+plot_targets = [targets[1], targets[2]]
 
+# attributes of the twiss object which are stored as simulation result
+twiss_attributes = ["s", "beta_x", "beta_y", "alpha_x", "alpha_y", "eta_x"]
+twiss_attributes += ["eta_x_dds", "psi_x", "psi_y", "tune_x", "tune_y", "alpha_c"]
+twiss_attributes += ["emittance_x", "i1", "i2", "i3", "i4", "i5"]
 
-def action(lattice, lattice_path: Path, output_dir: Path):
-    output_dir.mkdir(exist_ok=True)
 
+def simulation_action(lattice, lattice_path: Path, result_path: Path):
+    "Run the simulation and store the twiss data and the number of sections"
     print("Compute simulation data")
-    lattice_obj = ap.Lattice.from_file(lattice_path)
-    twiss_data = ap.Twiss(lattice_obj, energy=lattice["energy"], steps_per_meter=100)
+    section, n_sections = periodic_section(lattice, lattice_path)
+    lattice_obj = apace_lattice(lattice_path)
+    with span("twiss"):
+        twiss = twiss_simulation(
+            lattice_obj.children[0] if section is not None else lattice_obj,
+            lattice["energy"],
+        )
+        twiss_data = {name: getattr(twiss, name) for name in twiss_attributes}
+    result_path.parent.mkdir(parents=True, exist_ok=True)
+    result_path.write_bytes(pickle.dumps((twiss_data, n_sections)))
+
+
+def tables_action(result_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    twiss_data, n_sections = pickle.loads(result_path.read_bytes())
+    twiss_data = SimpleNamespace(**twiss_data)
 
     print("Generating tables 📝")
-    with (output_dir / targets[0]).open("w") as file:
-        json.dump(twiss_tables(twiss_data), file)
+    with span("tables"), (output_dir / targets[0]).open("w") as file:
+        json.dump(twiss_tables(twiss_data, n_sections), file)
+    with span("optics export"):
+        optics_export.save(output_dir / targets[3], optics_columns(twiss_data))
 
-    print("Generating twiss plot 📊")
-    twiss_plot(twiss_data).savefig(output_dir / targets[1])
 
-    print("Generating floor plan 📊")
-    floor_plan_plot(lattice_obj).savefig(output_dir / targets[2])
+def plots_action(result_path: Path, lattice_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    twiss_data, _ = pickle.loads(result_path.read_bytes())
+    twiss_data = SimpleNamespace(**twiss_data)
+    lattice_obj = apace_lattice(lattice_path)
 
+    report = new_report()
+    print("Generating twiss plot 📊")
+    cell = lattice_obj.children[0]
+    render(output_dir / targets[1], twiss_plot, twiss_data, cell, report=report)
 
-def twiss_tables(twiss: ap.Twiss):
+    print("Generating floor plan 📊")
+    render(output_dir / targets[2], floor_plan_plot, lattice_obj, report=report)
+    save_report(report, output_dir)
+
+
+def twiss_simulation(lattice: "ap.Lattice", energy: float):
+    "Compute the twiss of the ring or only of one of its identical sections"
+    import apace as ap
+
+    return ap.Twiss(lattice, energy=energy, steps_per_meter=100)
+
+
+class ScanModel:
+    "The lattice loaded once, the scan parameters are changed in place"
+
+    def __init__(self, lattice, lattice_path: Path):
+        section, self.n_sections = periodic_section(lattice, lattice_path)
+        lattice_obj = apace_lattice(lattice_path)
+        self.lattice = lattice_obj.children[0] if section is not None else lattice_obj
+        self.elements = {element.name: element for element in lattice_obj.sequence}
+        self.energy = lattice["energy"]
+
+    def update(self, parameter, value):
+        "Set the `energy` or an element attribute like `Q1.k1`"
+        if parameter == "energy":
+            self.energy = value
+        else:
+            element, attribute = parameter.split(".")
+            setattr(self.elements[element], attribute, value)
+
+    def tables(self):
+        twiss = twiss_simulation(self.lattice, self.energy)
+        return twiss_tables(twiss, self.n_sections)
+
+
+def optics_columns(twiss: "ap.Twiss"):
+    "Returns the optics arrays on the schema of `optics_export`"
+    return {
+        "s": twiss.s,
+        "beta_x": twiss.beta_x,
+        "alpha_x": twiss.alpha_x,
+        "psi_x": twiss.psi_x,
+        "eta_x": twiss.eta_x,
+        "eta_px": twiss.eta_x_dds,
+        "beta_y": twiss.beta_y,
+        "alpha_y": twiss.alpha_y,
+        "psi_y": twiss.psi_y,
+    }
+
+
+def check_periodic(lattice, lattice_path: Path):
+    "Returns the relative deviations of the periodic-cell from the full-ring tables"
+    section, n_sections = periodic_section({**lattice, "periodic": True}, lattice_path)
+    if section is None:
+        raise ValueError("The lattice is not fully symmetric")
+    lattice_obj = apace_lattice(lattice_path)
+    full = twiss_simulation(lattice_obj, lattice["energy"])
+    periodic = twiss_simulation(lattice_obj.children[0], lattice["energy"])
+    return relative_deviations(twiss_tables(full), twiss_tables(periodic, n_sections))
+
+
+def twiss_tables(twiss: "ap.Twiss", n_sections=1):
+    "Summary tables, ring quantities are scaled when `twiss` is of one section only"
+    import numpy as np
+
+    n = n_sections
     return [
         [
             "Optical Functions",
@@ -42,7 +145,7 @@ def twiss_tables(twiss: ap.Twiss):
             "Detailed Lattice Parameter",
             [
                 [
-                    ["Qₓ", twiss.tune_x],
+                    ["Qₓ", n * twiss.tune_x],
                     # TODO: fix chroma in apace
                     # ["Chromaticity x", twiss.chromaticity_x],
                     ["βₓ,ₘₐₓ / m", np.max(twiss.beta_x)],
@@ -51,7 +154,7 @@ def twiss_tables(twiss: ap.Twiss):
                     ["ηₓ,ₘₐₓ / m", np.max(twiss.eta_x)],
                 ],
                 [
-                    ["Qᵧ", twiss.tune_y],
+                    ["Qᵧ", n * twiss.tune_y],
                     # TODO: fix chroma in apace
                     # ["Chromaticity y", twiss.chromaticity_y],
                     ["βᵧ,ₘₐₓ / m", np.max(twiss.beta_y)],
@@ -62,11 +165,11 @@ def twiss_tables(twiss: ap.Twiss):
                 [
                     ["Mom. compaction", twiss.alpha_c],
                     ["Emittance", twiss.emittance_x],
-                    ["I₁", twiss.i1],
-                    ["I₂", twiss.i2],
-                    ["I₃", twiss.i3],
-                    ["I₄", twiss.i4],
-                    ["I₅", twiss.i5],
+                    ["I₁", n * twiss.i1],
+                    ["I₂", n * twiss.i2],
+                    ["I₃", n * twiss.i3],
+                    ["I₄", n * twiss.i4],
+                    ["I₅", n * twiss.i5],
                 ],
             ],
         ],
@@ -77,21 +180,32 @@ def twiss_tables(twiss: ap.Twiss):
     ]
 
 
-def twiss_plot(twiss: ap.Twiss):
+def twiss_plot(twiss: "ap.Twiss", cell: "ap.Lattice", budget=BUDGET):
     from math import floor, log10
 
-    from apace.plot import Color, draw_elements, draw_sub_lattices, plot_twiss
+    import numpy as np
+    from apace.plot import Color, draw_elements, draw_sub_lattices
 
     factor = np.max(twiss.beta_x) / np.max(twiss.eta_x)
     eta_x_scale = 10 ** floor(log10(factor))
-    cell = twiss.lattice.children[0]
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    s, beta_x, beta_y, eta_x = decimate(
+        twiss.s,
+        twiss.beta_x,
+        twiss.beta_y,
+        twiss.eta_x,
+        budget=budget,
+        x_range=(0, cell.length),
+    )
+    fig = new_figure()
+    ax = fig.subplots()
     ax.set_xlim(0, cell.length)
-    plot_twiss(ax, twiss, scales={"eta_x": eta_x_scale})
+    ax.plot(s, beta_x, "#EF4444", label=r"$\beta_x$ / m")
+    ax.plot(s, beta_y, "#1D4ED8", label=r"$\beta_y$ / m")
+    ax.plot(s, eta_x_scale * eta_x, "#10B981", label=rf"{eta_x_scale} $\eta_x$ / m")
     draw_elements(ax, cell, labels=len(cell.sequence) < 150)
     draw_sub_lattices(ax, cell, labels=len(cell.children) < 5)
     ax.grid(axis="y", color=Color.LIGHT_GRAY, linestyle="--", linewidth=1)
-    plt.legend(
+    ax.legend(
         bbox_to_anchor=(0, 1.05, 1, 0.2),
         loc="lower left",
         mode="expand",
@@ -103,14 +217,15 @@ def twiss_plot(twiss: ap.Twiss):
     return fig
 
 
-def floor_plan_plot(lattice: ap.Lattice):
+def floor_plan_plot(lattice: "ap.Lattice"):
     from apace.plot import floor_plan
 
     # fig_ring, ax = plt.subplots()
     # ax.axis("off")
     # floor_plan(ax, lattice, labels=False)
 
-    fig_cell, ax = plt.subplots(figsize=FIG_SIZE)
+    fig_cell = new_figure()
+    ax = fig_cell.subplots()
     ax.axis("off")
     cell = lattice.children[0]
     floor_plan(ax, cell)
@@ -2,36 +2,159 @@ import json
 from operator import itemgetter
 from pathlib import Path
 
-import matplotlib.pyplot as plt
-import numpy as np
-from eleganttools import SDDS, draw_elements
-
-from . import FIG_SIZE, simulation_dir
+from . import PLOT_FORMAT, config_dir, optics_export, sdds, simulation_dir
+from .plotting import BUDGET, decimate, new_figure, new_report, render, save_report
+from .timing import span
 
 simulation_elegant_dir = simulation_dir / "elegant"
 simulation_elegant_dir.mkdir(exist_ok=True)
 
 targets = [
     "twiss_tables.json",
-    "twiss.svg",
-    "chroma.svg",
+    f"twiss.{PLOT_FORMAT}",
+    f"chroma.{PLOT_FORMAT}",
+    optics_export.target,
 ]
+table_targets = [targets[0], targets[3]]
+plot_targets = [targets[1], targets[2]]
 
+run_file = config_dir / "twiss.ele"
 
-def action(twiss_data_path: Path, output_dir: Path):
-    output_dir.mkdir(exist_ok=True)
+# columns of the .twi file used by the plots, including those of `draw_elements`
+plot_columns = ["s", "betax", "betay", "etax", "ElementName", "ElementType"]
+# parameters of the .twi file used by `chroma_plot`, a constant instead of
+# `published_parameters` keeps `twiss_tables` out of the fingerprint of the plots
+chroma_parameters = [
+    "dnux/dp",
+    "dnux/dp2",
+    "dnux/dp3",
+    "dnuy/dp",
+    "dnuy/dp2",
+    "dnuy/dp3",
+]
+
+# optics_export schema -> column of the .twi file
+optics_columns = {
+    "s": "s",
+    "beta_x": "betax",
+    "alpha_x": "alphax",
+    "psi_x": "psix",
+    "eta_x": "etax",
+    "eta_px": "etaxp",
+    "beta_y": "betay",
+    "alpha_y": "alphay",
+    "psi_y": "psiy",
+    "eta_y": "etay",
+    "eta_py": "etayp",
+}
+
+# maximum slice length / m per element type
+profiles = {
+    "reference": {"drift": 0.03, "quadrupole": 0.03, "sextupole": 0.03, "bend": 0.03},
+    "publish": {"drift": 0.1, "quadrupole": 0.03, "sextupole": 0.05, "bend": 0.05},
+    "quick": {"drift": 0.5, "quadrupole": 0.1, "sextupole": 0.1, "bend": 0.1},
+}
+default_profile = "publish"
+
+# maximum relative deviation of the parameters of a profile from "reference",
+# checked by benchmarks.elegant_profiles
+profile_tolerances = {"nux": 1e-4, "nuy": 1e-4, "dnux/dp": 1e-2, "dnuy/dp": 1e-2}
 
-    twiss_data = SDDS(twiss_data_path).as_dict()
+# expensive twiss_output switches and the parameters they compute
+extras = {
+    "higher_order_chromaticity": {"dnux/dp2", "dnux/dp3", "dnuy/dp2", "dnuy/dp3"},
+    "compute_driving_terms": set(
+        "h11001 h00111 h20001 h00201 h10002 h21000 h30000 h10110 h10020 h10200 "
+        "h22000 h11110 h00220 h31000 h40000 h20110 h11200 h20020 h20200 h00310 "
+        "h00400 dnux/dJx dnux/dJy dnuy/dJy".split()
+    ),
+}
+
+
+def tables_action(twiss_data_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    columns = optics_columns.values()
+    with span("read sdds"):
+        twiss_data = sdds.read(twiss_data_path, columns, published_parameters())
 
     print(f"Generating tables 📝")
-    with (output_dir / targets[0]).open("w") as file:
+    with span("tables"), (output_dir / targets[0]).open("w") as file:
         json.dump(twiss_tables(twiss_data), file)
+    with span("optics export"):
+        optics_export.save(
+            output_dir / targets[3],
+            {name: twiss_data[column] for name, column in optics_columns.items()},
+        )
+
+
+def plots_action(twiss_data_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    with span("read sdds"):
+        twiss_data = sdds.read(twiss_data_path, plot_columns, chroma_parameters)
 
+    report = new_report()
     print(f"Generating twiss plot 📊")
-    twiss_plot(twiss_data).savefig(output_dir / targets[1])
+    render(output_dir / targets[1], twiss_plot, twiss_data, report=report)
 
     print(f"Generate chroma plot 📊")
-    chroma_plot(twiss_data).savefig(output_dir / targets[2])
+    render(output_dir / targets[2], chroma_plot, twiss_data, report=report)
+    save_report(report, output_dir)
+
+
+def run_command(
+    lattice_path: Path, energy, target: Path, profile=None, executable="elegant"
+):
+    "Returns the elegant command line to compute the twiss data of a lattice"
+    macros = {
+        "energy": energy,
+        "lattice": lattice_path,
+        "filename": target,
+        **run_macros(profile),
+    }
+    macro = ",".join(f"{key}={value}" for key, value in macros.items())
+    return [executable, str(run_file), f"-macro={macro}"]
+
+
+def run_macros(profile=None):
+    "Returns the macros of the run file for a simulation profile"
+    slices = profiles[profile or default_profile]
+    used = published_parameters() | set(chroma_parameters)
+    return {
+        **{f"{element_type}_slice": length for element_type, length in slices.items()},
+        **{name: int(not used.isdisjoint(extras[name])) for name in extras},
+    }
+
+
+def tolerance_violations(reference: dict, data: dict) -> dict:
+    """Returns the parameters of `profile_tolerances` whose relative deviation from
+    the `reference` run exceeds the tolerance, as name -> deviation.
+    """
+    deviations = {
+        name: (
+            abs(data[name] - reference[name]) / abs(reference[name])
+            if reference[name]
+            else abs(data[name])
+        )
+        for name in profile_tolerances
+    }
+    return {
+        name: deviation
+        for name, deviation in deviations.items()
+        if deviation > profile_tolerances[name]
+    }
+
+
+def published_parameters():
+    "Returns the names of the SDDS parameters used by `twiss_tables`"
+    accessed = set()
+
+    class Recorder(dict):
+        def __missing__(self, key):
+            accessed.add(key)
+            return 1.0
+
+    twiss_tables(Recorder())
+    return accessed
 
 
 def twiss_tables(data):
@@ -90,25 +213,33 @@ def twiss_tables(data):
     ]
 
 
-def twiss_plot(data):
+def twiss_plot(data, budget=BUDGET):
     from math import floor, log10
 
+    import numpy as np
+    from eleganttools import draw_elements
+
     factor = np.max(data["betax"]) / np.max(data["etax"])
     eta_x_scale = 10 ** floor(log10(factor))
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
-    ax.plot(data["s"], data["betax"], "#EF4444", label=r"$\beta_x$ / m")
-    ax.plot(data["s"], data["betay"], "#1D4ED8", label=r"$\beta_y$ / m")
-    ax.plot(
+    x_range = 0, 15  # TODO: use cell length!
+    s, betax, betay, etax = decimate(
         data["s"],
-        eta_x_scale * data["etax"],
-        "#10B981",
-        label=rf"{eta_x_scale} $\eta_x$ / m",
+        data["betax"],
+        data["betay"],
+        data["etax"],
+        budget=budget,
+        x_range=x_range,
     )
+    fig = new_figure()
+    ax = fig.subplots()
+    ax.plot(s, betax, "#EF4444", label=r"$\beta_x$ / m")
+    ax.plot(s, betay, "#1D4ED8", label=r"$\beta_y$ / m")
+    ax.plot(s, eta_x_scale * etax, "#10B981", label=rf"{eta_x_scale} $\eta_x$ / m")
     ax.set_xlabel("position s / m")
     ax.grid(color="#E5E7EB", linestyle="--", linewidth=1)
-    ax.set_xlim(0, 15)  # TODO: use cell length!
+    ax.set_xlim(*x_range)
     draw_elements(ax, data, labels=True)
-    plt.legend(
+    ax.legend(
         bbox_to_anchor=(0, 1.05, 1, 0.2),
         loc="lower left",
         mode="expand",
@@ -121,12 +252,15 @@ def twiss_plot(data):
 
 
 def chroma_plot(data):
+    import numpy as np
+
     domain = -0.02, 0.02
-    coef_x = (0, *itemgetter("dnux/dp", "dnux/dp2", "dnux/dp3")(data))
-    coef_y = (0, *itemgetter("dnuy/dp", "dnuy/dp2", "dnuy/dp3")(data))
+    coef_x = (0, *itemgetter(*chroma_parameters[:3])(data))
+    coef_y = (0, *itemgetter(*chroma_parameters[3:])(data))
     chroma_x = np.polynomial.Polynomial(coef_x)
     chroma_y = np.polynomial.Polynomial(coef_y)
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig = new_figure()
+    ax = fig.subplots()
     ax.plot(*chroma_x.linspace(domain=domain), label=r"$\nu_x$")
     ax.plot(*chroma_y.linspace(domain=domain), label=r"$\nu_y$")
     ax.set_xlabel(r"$\Delta p / p$")
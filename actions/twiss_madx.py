@@ -1,42 +1,146 @@
 import json
+import pickle
 from pathlib import Path
+from types import SimpleNamespace
 
-import matplotlib.pyplot as plt
-import numpy as np
-from cpymad.madx import Madx
+from . import PLOT_FORMAT, madx_pool, optics_export, simulation_dir
+from .lattice_info import periodic_section
+from .plotting import BUDGET, decimate, new_figure, new_report, render, save_report
+from .tables import relative_deviations
+from .timing import span
 
-from . import FIG_SIZE
+simulation_madx_dir = simulation_dir / "madx"
+simulation_madx_dir.mkdir(exist_ok=True)
 
 targets = [
     "twiss_tables.json",
-    "twiss.svg",
+    f"twiss.{PLOT_FORMAT}",
+    optics_export.target,
 ]
+table_targets = [targets[0], targets[2]]
+plot_targets = [targets[1]]
 
+# twiss columns which are copied out of the MAD-X process
+columns = ["name", "keyword", "s", "l", "betx", "alfx", "mux", "dx", "dpx"]
+columns += ["bety", "alfy", "muy", "dy", "dpy", "angle", "k1l", "k2l"]
 
-def action(lattice, lattice_path: Path, output_dir: Path):
-    output_dir.mkdir(exist_ok=True)
+
+def simulation_action(lattice, lattice_path: Path, result_path: Path):
+    "Run the simulation and store the twiss data and the number of sections"
+    section, n_sections = periodic_section(lattice, lattice_path)
 
     print(f"Run madx simulation ⚙")
-    twiss_data = twiss_simulation(lattice_path, lattice["energy"])
+    with span("twiss"):
+        twiss_data = twiss_simulation(lattice_path, lattice["energy"], section)
+    result_path.parent.mkdir(parents=True, exist_ok=True)
+    result_path.write_bytes(pickle.dumps((twiss_data, n_sections)))
+
+
+def tables_action(result_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    twiss_data, n_sections = pickle.loads(result_path.read_bytes())
 
     print(f"Generating tables 📝")
-    with (output_dir / targets[0]).open("w") as file:
-        json.dump(twiss_tables(twiss_data), file)
+    with span("tables"), (output_dir / targets[0]).open("w") as file:
+        json.dump(twiss_tables(twiss_data, n_sections), file)
+    with span("optics export"):
+        optics_export.save(output_dir / targets[2], optics_columns(twiss_data))
+
 
+def plots_action(result_path: Path, output_dir: Path):
+    output_dir.mkdir(exist_ok=True)
+    twiss_data, _ = pickle.loads(result_path.read_bytes())
+
+    report = new_report()
     print(f"Generating twiss plot 📊")
-    twiss_plot(twiss_data).savefig(output_dir / targets[1])
+    render(output_dir / targets[1], twiss_plot, twiss_data, report=report)
+    save_report(report, output_dir)
+
+
+def twiss_simulation(path: Path, energy: float, section=None):
+    "Compute the twiss of the ring or only of one of its identical sections"
+    return twiss_of_input(path.read_text(), energy, section)
+
+
+def twiss_of_input(madx_input: str, energy: float, section=None):
+    "Like `twiss_simulation`, but of a lattice given as MAD-X input"
+    with madx_pool.instance() as madx:
+        madx.command.beam(particle="electron", energy=energy, charge=-1)
+        madx.input(madx_input)
+        if section is not None:
+            madx.use(sequence=section)
+        twiss = madx.twiss(chrom=True)
+        return TwissData(twiss.copy(columns), twiss.summary)
+
 
+class TwissData(dict):
+    "Twiss columns detached from the MAD-X process, the summary is an attribute"
 
-def twiss_simulation(path: Path, energy: float):
-    madx = Madx(stdout=False)
-    madx.options.info = False
-    madx.command.beam(particle="electron", energy=energy, charge=-1)
-    madx.input(path.read_text())
-    return madx.twiss(chrom=True)
+    def __init__(self, columns, summary):
+        super().__init__(columns)
+        self.summary = SimpleNamespace(**summary)
 
 
-def twiss_tables(twiss):
+class ScanModel:
+    "The lattice loaded once into MAD-X, the scan parameters are changed in place"
+
+    def __init__(self, lattice, lattice_path: Path):
+        from cpymad.madx import Madx
+
+        section, self.n_sections = periodic_section(lattice, lattice_path)
+        self.madx = Madx(stdout=False)
+        self.madx.options.info = False
+        self.update("energy", lattice["energy"])
+        self.madx.input(lattice_path.read_text())
+        if section is not None:
+            self.madx.use(sequence=section)
+
+    def update(self, parameter, value):
+        "Set the `energy` or an element attribute like `Q1.k1`"
+        if parameter == "energy":
+            self.madx.command.beam(particle="electron", energy=value, charge=-1)
+        else:
+            element, attribute = parameter.split(".")
+            setattr(self.madx.elements[element], attribute, value)
+
+    def tables(self):
+        twiss = self.madx.twiss(chrom=True)
+        return twiss_tables(TwissData({}, twiss.summary), self.n_sections)
+
+
+def optics_columns(twiss):
+    "Returns the optics arrays on the schema of `optics_export`"
+    import numpy as np
+
+    return {
+        "s": twiss["s"],
+        "beta_x": twiss["betx"],
+        "alpha_x": twiss["alfx"],
+        "psi_x": 2 * np.pi * twiss["mux"],
+        "eta_x": twiss["dx"],
+        "eta_px": twiss["dpx"],
+        "beta_y": twiss["bety"],
+        "alpha_y": twiss["alfy"],
+        "psi_y": 2 * np.pi * twiss["muy"],
+        "eta_y": twiss["dy"],
+        "eta_py": twiss["dpy"],
+    }
+
+
+def check_periodic(lattice, lattice_path: Path):
+    "Returns the relative deviations of the periodic-cell from the full-ring tables"
+    section, n_sections = periodic_section({**lattice, "periodic": True}, lattice_path)
+    if section is None:
+        raise ValueError("The lattice is not fully symmetric")
+    full = twiss_simulation(lattice_path, lattice["energy"])
+    periodic = twiss_simulation(lattice_path, lattice["energy"], section)
+    return relative_deviations(twiss_tables(full), twiss_tables(periodic, n_sections))
+
+
+def twiss_tables(twiss, n_sections=1):
+    "Summary tables, ring quantities are scaled when `twiss` is of one section only"
     twiss = twiss.summary
+    n = n_sections
     return [
         [
             "Optical Functions",
@@ -51,15 +155,15 @@ def twiss_tables(twiss):
                     ["transition energy", twiss.gammatr],
                 ],
                 [
-                    ["tune x", twiss.q1],
-                    ["chromaticity x", twiss.dq1],
+                    ["tune x", n * twiss.q1],
+                    ["chromaticity x", n * twiss.dq1],
                     ["max beta x", twiss.betxmax],
                     ["max eta x", twiss.dxmax],
                 ],
                 [
-                    ["Tune y", twiss.q2],
-                    ["Chromaticity y", twiss.dq2],
-                    ["max beta y", twiss.betxmax],
+                    ["Tune y", n * twiss.q2],
+                    ["Chromaticity y", n * twiss.dq2],
+                    ["max beta y", twiss.betymax],
                     ["max eta y", twiss.dymax],
                 ],
             ],
@@ -68,27 +172,39 @@ def twiss_tables(twiss):
             "Synchrotron Radiation Integrals",
             [
                 [
-                    ["I1", twiss.synch_1],
-                    ["I2", twiss.synch_2],
-                    ["I3", twiss.synch_3],
-                    ["I4", twiss.synch_4],
-                    ["I5", twiss.synch_5],
+                    ["I1", n * twiss.synch_1],
+                    ["I2", n * twiss.synch_2],
+                    ["I3", n * twiss.synch_3],
+                    ["I4", n * twiss.synch_4],
+                    ["I5", n * twiss.synch_5],
                 ]
             ],
         ],
     ]
 
 
-def twiss_plot(twiss):
+def twiss_plot(twiss, budget=BUDGET):
     from math import floor, log10
 
+    import numpy as np
+
     factor = np.max(twiss.summary.betxmax) / np.max(twiss.summary.dxmax)
     eta_x_scale = 10 ** floor(log10(factor))
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
-    ax.plot(twiss["s"], twiss["betx"], "#EF4444")
-    ax.plot(twiss["s"], twiss["bety"], "#1D4ED8")
-    ax.plot(twiss["s"], eta_x_scale * twiss["dx"], "#10B981")
+    x_range = 0, 20  # TODO: use cell length!
+    s, betx, bety, dx = decimate(
+        twiss["s"],
+        twiss["betx"],
+        twiss["bety"],
+        twiss["dx"],
+        budget=budget,
+        x_range=x_range,
+    )
+    fig = new_figure()
+    ax = fig.subplots()
+    ax.plot(s, betx, "#EF4444")
+    ax.plot(s, bety, "#1D4ED8")
+    ax.plot(s, eta_x_scale * dx, "#10B981")
     ax.grid(color="#E5E7EB", linestyle="--", linewidth=1)
-    ax.set_xlim(0, 20)  # TODO: use cell length!
+    ax.set_xlim(*x_range)
     fig.tight_layout()
     return fig
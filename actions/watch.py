@@ -0,0 +1,128 @@
+"""Watch the data directory and rebuild the summaries of edited lattices.
+
+    poetry run python -m actions.watch
+
+The process stays warm: the heavy modules, the tasks of dodo.py and the info
+index are loaded once. When a lattice file changes, only the tasks of that
+lattice run, in stages with the fastest results first: the lattice info and
+the tables, then the plots, then scans and the comparisons. When an
+info.toml changes, all lattices of its namespace are checked. Changes are
+detected by polling the modification times, so no extra package is needed.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from doit.cmd_base import ModuleTaskLoader
+from doit.doit_cmd import DoitMain
+
+from . import base_dir, code_comparison, pool, render_pool, scan
+
+lattice_suffixes = {".json", ".lte", ".madx"}
+
+
+def snapshot(data_dir: Path) -> dict:
+    "Returns a dict of path -> (mtime, size) of the lattice and info.toml files"
+    result = {}
+    for path in data_dir.rglob("*"):
+        if path.suffix in lattice_suffixes or path.name == "info.toml":
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # removed in the meantime
+            result[path] = stat.st_mtime_ns, stat.st_size
+    return result
+
+
+def changed_files(before: dict, after: dict) -> list:
+    "Returns the paths which were added, modified or removed"
+    return sorted(
+        path
+        for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    )
+
+
+def stages(lattices) -> list:
+    "Returns the stages to run for `lattices`, a list of (title, task names)"
+    tables, plots, rest = ["index_json"], [], []
+    for lattice in lattices:
+        sub_task = "{namespace}/{name}".format(**lattice)
+        tables += [
+            f"convert_lattices:{sub_task}",
+            f"index_json_per_lattice:{sub_task}",
+            f"lattice_info:{sub_task}",
+        ]
+        for simulation in lattice["simulations"]:
+            tables.append(f"{simulation}_tables:{sub_task}")
+            plots.append(f"{simulation}_plots:{sub_task}")
+            if "scan" in lattice and simulation in scan.codes:
+                rest.append(f"{simulation}_scan:{sub_task}")
+        codes = set(lattice["simulations"]) & set(code_comparison.codes)
+        if len(codes) > 1:
+            rest.append(f"code_comparison:{sub_task}")
+    namespaces = dict.fromkeys(lattice["namespace"] for lattice in lattices)
+    rest += [f"comparison:{namespace}" for namespace in namespaces]
+    groups = [("tables", tables), ("plots", plots), ("scans and comparison", rest)]
+    return [(title, tasks) for title, tasks in groups if tasks]
+
+
+def affected_lattices(dodo, paths) -> list:
+    "Returns the info entries of the lattices affected by the changed `paths`"
+    dodo.lattices_by_info_file.cache_clear()
+    dodo.source_files.cache_clear()
+    namespaces = {path.parent.stem for path in paths if path.name == "info.toml"}
+    names = {
+        (path.parent.stem, path.stem) for path in paths if path.name != "info.toml"
+    }
+    return [
+        lattice
+        for lattice in dodo.lattices_all()
+        if lattice["namespace"] in namespaces
+        or (lattice["namespace"], lattice["name"]) in names
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=float, default=0.1, help="poll interval / s")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(base_dir))
+    import dodo
+
+    pool._warm_up()
+    if dodo.worker_pool:
+        pool.run("os", "getpid", ())  # start a worker before the first change
+    loader = ModuleTaskLoader(dodo)
+    print(f"Watching {dodo.data_dir} 👀")
+    before = snapshot(dodo.data_dir)
+    while True:
+        time.sleep(args.interval)
+        after = snapshot(dodo.data_dir)
+        if after == before:
+            continue
+        time.sleep(args.interval)  # editors may write a file in several steps
+        after = snapshot(dodo.data_dir)
+        paths = changed_files(before, after)
+        before = after
+
+        start = time.perf_counter()
+        lattices = affected_lattices(dodo, paths)
+        print(f"Changed: {', '.join(path.name for path in paths)} 🔁")
+        for title, tasks in stages(lattices):
+            render_pool.errors.clear()
+            try:
+                exit_code = DoitMain(loader).run(tasks)
+            except SystemExit as exit:  # failed background renders
+                exit_code = exit.code
+            render_pool.wait()  # a stage is done when its plots are rendered
+            if exit_code != 0 or render_pool.errors:
+                break
+            print(f"Updated {title} after {time.perf_counter() - start:.2f} s ✔")
+
+
+if __name__ == "__main__":
+    main()
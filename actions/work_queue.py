@@ -0,0 +1,296 @@
+"""Distributed execution of the doit tasks through a work queue in SQLite.
+
+    poetry run python -m actions.work_queue publish [task ...]
+    poetry run python -m actions.work_queue worker      # on every node
+    poetry run python -m actions.work_queue status
+
+`publish` loads the tasks of dodo.py and writes the selected tasks and all
+tasks they depend on, with their dependencies, to the queue (`WORK_QUEUE` in
+config.toml, a file on a filesystem shared by the nodes). Workers claim tasks
+whose dependencies are done and run them with doit, one at a time, in a forked
+process. A claimed task is leased to its worker, which renews the lease while
+the task runs. When the lease of a dead worker expires the task is claimed
+again, after `MAX_ATTEMPTS` claims it counts as failed. A worker which could not
+renew its lease in time, e.g. after a stall of the shared filesystem, kills its
+run of the task, so only the new worker writes the targets. The workers share a
+doit dependency file in SQLite, so each task is checked for being up-to-date as
+usual.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from . import base_dir, config
+
+queue_path = base_dir / str(config.get("WORK_QUEUE", "_cache/work_queue.sqlite"))
+
+LEASE = 60.0
+MAX_ATTEMPTS = 3
+
+schema = """
+CREATE TABLE IF NOT EXISTS tasks (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done or failed
+    targets TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    wall REAL,
+    exit_code INTEGER
+);
+CREATE TABLE IF NOT EXISTS deps (
+    task TEXT NOT NULL,
+    dep TEXT NOT NULL,
+    PRIMARY KEY (task, dep)
+);
+"""
+
+# tasks which are pending (or leased to a dead worker) and whose deps are done
+ready_query = """
+SELECT name FROM tasks
+WHERE (state = 'pending' OR (state = 'running' AND lease_until < :now))
+AND attempts < :max_attempts
+AND NOT EXISTS (
+    SELECT 1 FROM deps JOIN tasks AS dep ON dep.name = deps.dep
+    WHERE deps.task = tasks.name AND dep.state != 'done'
+)
+ORDER BY rowid LIMIT 1
+"""
+
+
+def connect(path: Path = None) -> sqlite3.Connection:
+    "Returns a connection to the queue, transactions are started explicitly"
+    path = Path(path or queue_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    connection.executescript(schema)
+    return connection
+
+
+def publish(connection, tasks):
+    """Add the doit `tasks` to the queue.
+
+    Tasks already in the queue are reset to pending, unless they are running,
+    which keeps the lease of their worker. `tasks` is a list of doit Task
+    objects with the implicit task deps of their file deps already added, e.g.
+    by `doit.control.TaskControl`.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    for task in tasks:
+        connection.execute(
+            "INSERT INTO tasks (name, targets) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET state = 'pending', "
+            "targets = excluded.targets, worker = NULL, lease_until = NULL, "
+            "attempts = 0, wall = NULL, exit_code = NULL "
+            "WHERE state != 'running'",
+            (task.name, "\n".join(task.targets)),
+        )
+        connection.execute("DELETE FROM deps WHERE task = ?", (task.name,))
+        connection.executemany(
+            "INSERT OR IGNORE INTO deps VALUES (?, ?)",
+            [(task.name, dep) for dep in (*task.task_dep, *task.setup_tasks)],
+        )
+    connection.execute("COMMIT")
+
+
+def claim(connection, worker, lease=LEASE):
+    "Returns the name of a ready task, which is now leased to `worker`, or None"
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute(
+            "UPDATE tasks SET state = 'failed' WHERE state = 'running' "
+            "AND lease_until < ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS),
+        )
+        row = connection.execute(
+            ready_query, {"now": now, "max_attempts": MAX_ATTEMPTS}
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE tasks SET state = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE name = ?",
+                (worker, now + lease, row[0]),
+            )
+    finally:
+        connection.execute("COMMIT")
+    return row and row[0]
+
+
+def renew(connection, name, worker, lease=LEASE) -> bool:
+    "Extend the lease of `worker` on task `name`, returns False if it was lost"
+    cursor = connection.execute(
+        "UPDATE tasks SET lease_until = ? WHERE name = ? AND worker = ? "
+        "AND state = 'running'",
+        (time.time() + lease, name, worker),
+    )
+    return cursor.rowcount == 1
+
+
+def complete(connection, name, worker, exit_code, wall):
+    "Report the result of task `name`, unless the lease was lost in the meantime"
+    connection.execute(
+        "UPDATE tasks SET state = ?, exit_code = ?, wall = ?, lease_until = NULL "
+        "WHERE name = ? AND worker = ? AND state = 'running'",
+        ("done" if exit_code == 0 else "failed", exit_code, wall, name, worker),
+    )
+
+
+def counts(connection) -> dict:
+    "Returns the number of tasks per state"
+    return dict(connection.execute("SELECT state, count(*) FROM tasks GROUP BY state"))
+
+
+def _renew_until(stop: threading.Event, lost: threading.Event, name, worker, lease):
+    connection = connect()
+    while not stop.wait(lease / 3):
+        if not renew(connection, name, worker, lease):
+            lost.set()
+            break
+    connection.close()
+
+
+def work(run, worker=None, lease=LEASE, poll=1.0) -> dict:
+    """Claim and `run(task_name, lost)` ready tasks until no task is left to run.
+
+    `run` returns the exit code of the task. It has to stop the task without
+    writing its targets when the event `lost` is set, as the lease was lost and
+    the task may already run on another worker. Returns the counts of the states.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    connection = connect()
+    while True:
+        name = claim(connection, worker, lease)
+        if name is None:
+            running = connection.execute(
+                "SELECT count(*) FROM tasks WHERE state = 'running'"
+            ).fetchone()[0]
+            if running == 0:  # the pending tasks wait for failed ones
+                return counts(connection)
+            time.sleep(poll)
+            continue
+
+        stop, lost = threading.Event(), threading.Event()
+        renewal = threading.Thread(
+            target=_renew_until, args=(stop, lost, name, worker, lease), daemon=True
+        )
+        renewal.start()
+        start = time.perf_counter()
+        try:
+            exit_code = run(name, lost)
+        except Exception as exception:
+            print(f"Task {name} failed: {exception!r}")
+            exit_code = 1
+        finally:
+            stop.set()
+            renewal.join()
+        if lost.is_set():
+            print(f"Lost the lease of {name}, it is left to another worker")
+        complete(connection, name, worker, exit_code, time.perf_counter() - start)
+
+
+def run_forked(function, args, lost: threading.Event, poll=0.1) -> int:
+    """Run `function(*args)` in a forked process, which shares the imports of this
+    one, and returns its result as exit code. The process is stopped when `lost`
+    is set: first by SIGTERM, which runs its cleanup, after 5 s by SIGKILL.
+    """
+    process = multiprocessing.get_context("fork").Process(
+        target=_exit_with, args=(function, args)
+    )
+    process.start()
+    while process.exitcode is None:
+        process.join(poll)
+        if lost.is_set() and process.exitcode is None:
+            process.terminate()
+            process.join(5)
+            if process.exitcode is None:
+                process.kill()
+                process.join()
+    return process.exitcode
+
+
+def _exit_with(function, args):
+    # unwind on SIGTERM, e.g. the scheduler kills the simulation it started
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    sys.exit(function(*args))
+
+
+def _load_dodo():
+    from doit.cmd_base import ModuleTaskLoader
+
+    sys.path.insert(0, str(base_dir))
+    import dodo
+
+    return ModuleTaskLoader(dodo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["publish", "worker", "status"])
+    parser.add_argument("tasks", nargs="*", help="tasks to publish, default: all")
+    parser.add_argument("--queue", type=Path, help="path of the queue")
+    parser.add_argument("--lease", type=float, default=LEASE, help="lease / s")
+    args = parser.parse_args()
+
+    global queue_path
+    queue_path = args.queue or queue_path
+    connection = connect()
+
+    if args.command == "publish":
+        from doit import loader
+        from doit.control import TaskControl
+
+        namespace = _load_dodo().namespace
+        control = TaskControl(loader.load_tasks(namespace))
+        control.process(args.tasks or None)
+        selected, queue = {}, list(control.selected_tasks)
+        while queue:
+            name = queue.pop()
+            if name not in selected:
+                selected[name] = control.tasks[name]
+                queue += [*selected[name].task_dep, *selected[name].setup_tasks]
+        publish(connection, selected.values())
+        print(f"Published {len(selected)} tasks to {queue_path} 📬")
+
+    elif args.command == "worker":
+        from doit.doit_cmd import DoitMain
+
+        from . import pool
+
+        task_loader = _load_dodo()
+        pool._warm_up()
+        doit_db = queue_path.with_name(queue_path.stem + ".doit.sqlite")
+
+        def run_doit(name):
+            # only this task, its deps are done by the queue
+            options = ["--backend", "sqlite3", "--db-file", str(doit_db), "-s"]
+            try:
+                return DoitMain(task_loader).run(["run", *options, name])
+            except SystemExit as exit:  # failed background renders
+                return exit.code
+
+        def run(name, lost):
+            return run_forked(run_doit, (name,), lost)
+
+        result = work(run, lease=args.lease)
+        print(f"No task left to run: {result}")
+        sys.exit(1 if result.get("failed") else 0)
+
+    else:
+        print(counts(connection))
+        for row in connection.execute(
+            "SELECT name, worker, attempts, exit_code FROM tasks WHERE state = 'failed'"
+        ):
+            print("failed: {} on {} after {} attempts, exit code {}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
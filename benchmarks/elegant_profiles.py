@@ -0,0 +1,87 @@
+"""Runtime of the elegant simulation profiles against the deviation of the
+published parameters from the "reference" profile (3 cm slices of everything).
+
+    poetry run python -m benchmarks.elegant_profiles path/to/lattice.lte 1700
+
+The exit code is 1 if the tunes or chromaticities of a profile deviate from the
+reference by more than `profile_tolerances`, then the lattice needs a finer
+profile in its info.toml.
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from actions import sdds
+from actions.tables import relative_deviations
+from actions.twiss_elegant import (
+    profile_tolerances,
+    profiles,
+    published_parameters,
+    run_command,
+    tolerance_violations,
+    twiss_tables,
+)
+
+
+def run_profile(lattice_path: Path, energy, profile, output_dir: Path):
+    "Returns the runtime and the parameters of an elegant run"
+    target = output_dir / f"{profile}.twi"
+    command = run_command(lattice_path, energy, target, profile)
+    start = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    runtime = time.perf_counter() - start
+    parameters = published_parameters() | set(profile_tolerances)
+    return runtime, sdds.read(target, [], parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("lattice", type=Path, help="elegant lattice file")
+    parser.add_argument("energy", type=float, help="energy / MeV")
+    parser.add_argument("--profiles", nargs="+", default=list(profiles))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            profile: run_profile(args.lattice, args.energy, profile, Path(tmp))
+            for profile in dict.fromkeys(["reference", *args.profiles])
+        }
+
+    reference_time, reference_data = results["reference"]
+    reference_tables = twiss_tables(reference_data)
+    print(f"{'profile':<10} {'runtime':>9} {'speedup':>8} {'max deviation':>14}")
+    failed = {}
+    for profile, (runtime, data) in results.items():
+        deviations = relative_deviations(reference_tables, twiss_tables(data))
+        worst = max(deviations, key=deviations.get, default=None)
+        deviation = f"{deviations[worst]:>14.2e} ({worst})" if worst else "no rows"
+        print(
+            f"{profile:<10} {runtime:>7.2f} s {reference_time / runtime:>7.1f}x "
+            f"{deviation:>14}"
+        )
+        violations = tolerance_violations(reference_data, data)
+        if violations:
+            failed[profile] = violations
+
+    # the profiles are ordered from fine to coarse
+    names = list(profiles)
+    for profile, violations in failed.items():
+        exceeded = ", ".join(
+            f"{name} {deviation:.2e} > {profile_tolerances[name]:.0e}"
+            for name, deviation in violations.items()
+        )
+        finer = names[max(names.index(profile) - 1, 0)]
+        print(
+            f"Profile {profile} exceeds the tolerance: {exceeded}, "
+            f'use e.g. profile = "{finer}" in the info.toml'
+        )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
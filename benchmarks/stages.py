@@ -0,0 +1,174 @@
+"""Runtime and peak memory of every stage for synthetic rings of growing size.
+
+    poetry run python -m benchmarks.stages --sizes 10 100 1000 10000 --save
+    poetry run python -m benchmarks.stages --threshold 0.2
+
+The results are compared with the saved baseline, the exit code is 1 if a stage
+got slower or needs more memory than the baseline by more than the threshold.
+The peak memory is traced by tracemalloc, which only sees allocations of the
+Python process, for elegant the peak RSS of its process is used. Stages of
+simulation codes which are not installed are skipped. All stages run once
+untimed before the measurements, so the first size does not pay for the start of
+the MAD-X instance of `madx_pool` or for first imports.
+"""
+
+import argparse
+import json
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib.util import find_spec
+from pathlib import Path
+from types import SimpleNamespace
+
+import latticejson
+import matplotlib.pyplot as plt
+
+from actions import PLOT_FORMAT, base_dir, config, lattice_cache
+
+from .synthetic import ring
+
+default_baseline = base_dir / "_cache" / "benchmarks" / "stages.json"
+
+# changes below these limits are noise
+MIN_TIME = 0.01
+MIN_MEMORY = 1024 * 1024
+
+
+class Stages(dict):
+    "Measures the stages of one lattice, a dict of stage -> time and peak memory"
+
+    def __call__(self, name, function, *args):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            value = function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self[name] = {"time": elapsed, "peak_memory": peak}
+        return value
+
+
+def run_stages(n_elements, skip, tmp: Path):
+    "Returns the time and peak memory of every stage for a ring of `n_elements`"
+    from actions import convert_lattices, lattice_info
+
+    lattice_cache.cache_dir = tmp / "cache"  # always start with a cold cache
+    source = tmp / "ring.json"
+    source.write_text(json.dumps(ring(n_elements)))
+    lattice = {"energy": 1700}
+    stages = Stages()
+    stages("parse", latticejson.load, source)
+    stages("convert", convert_lattices.action, source, [tmp / "ring.lte"])
+    stages("lattice_info", lattice_info.action, lattice, source, tmp / "info")
+
+    if "apace" not in skip and find_spec("apace"):
+        from actions import twiss_apace
+
+        result, output_dir = tmp / "apace.pickle", tmp / "apace"
+        stages("apace twiss", twiss_apace.simulation_action, lattice, source, result)
+        stages("apace tables", twiss_apace.tables_action, result, output_dir)
+        twiss = SimpleNamespace(**pickle.loads(result.read_bytes())[0])
+        cell = lattice_cache.apace_lattice(source).children[0]
+        fig = stages("apace plot", twiss_apace.twiss_plot, twiss, cell)
+        stages("apace savefig", fig.savefig, output_dir / f"twiss.{PLOT_FORMAT}")
+        plt.close(fig)
+
+    if "madx" not in skip and find_spec("cpymad"):
+        from actions import twiss_madx
+
+        madx_path, result = tmp / "ring.madx", tmp / "madx.pickle"
+        output_dir = tmp / "madx"
+        convert_lattices.action(source, [madx_path])
+        stages("madx twiss", twiss_madx.simulation_action, lattice, madx_path, result)
+        stages("madx tables", twiss_madx.tables_action, result, output_dir)
+        twiss, _ = pickle.loads(result.read_bytes())
+        fig = stages("madx plot", twiss_madx.twiss_plot, twiss)
+        stages("madx savefig", fig.savefig, output_dir / f"twiss.{PLOT_FORMAT}")
+        plt.close(fig)
+
+    executable = str(config.get("ELEGANT", "elegant"))
+    if "elegant" not in skip and find_spec("eleganttools") and shutil.which(executable):
+        from actions import scheduler, sdds, twiss_elegant
+
+        twi, output_dir = tmp / "ring.twi", tmp / "elegant"
+        command = twiss_elegant.run_command(
+            tmp / "ring.lte", lattice["energy"], twi, executable=executable
+        )
+        stages("elegant twiss", scheduler.run, command, twi.with_suffix(".log"))
+        run = json.loads(twi.with_suffix(".run.json").read_text())
+        stages["elegant twiss"]["peak_memory"] = run["peak_rss"]
+        stages("elegant tables", twiss_elegant.tables_action, twi, output_dir)
+        data = sdds.read(
+            twi, twiss_elegant.plot_columns, twiss_elegant.published_parameters()
+        )
+        fig = stages("elegant plot", twiss_elegant.twiss_plot, data)
+        stages("elegant savefig", fig.savefig, output_dir / f"twiss.{PLOT_FORMAT}")
+        plt.close(fig)
+    return stages
+
+
+def regressions(results, baseline, threshold):
+    "Yields the stages which are worse than the baseline by more than `threshold`"
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(size, {}).get(stage)
+            if previous is None:
+                continue
+            for quantity, minimum in (("time", MIN_TIME), ("peak_memory", MIN_MEMORY)):
+                old, new = previous[quantity], current[quantity]
+                if new > minimum and new > (1 + threshold) * old:
+                    yield size, stage, quantity, old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("--baseline", type=Path, default=default_baseline)
+    parser.add_argument("--save", action="store_true", help="save as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--skip", nargs="*", default=[], help="e.g. elegant madx")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:  # warm up
+        run_stages(min(args.sizes), args.skip, Path(tmp))
+    results = {}
+    for n_elements in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            results[str(n_elements)] = run_stages(n_elements, args.skip, Path(tmp))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print(
+        f"{'elements':>8} {'stage':<16} {'time':>9} {'peak memory':>12} {'change':>8}"
+    )
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(size, {}).get(stage)
+            change = (
+                f"{current['time'] / previous['time'] - 1:+.0%}" if previous else ""
+            )
+            print(
+                f"{size:>8} {stage:<16} {current['time']:>7.3f} s "
+                f"{current['peak_memory'] / 1024**2:>9.1f} MiB {change:>8}"
+            )
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    found = list(regressions(results, baseline, args.threshold))
+    for size, stage, quantity, old, new in found:
+        print(f"Regression: {stage} ({size} elements) {quantity} {old:.3g} → {new:.3g}")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
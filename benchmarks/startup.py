@@ -0,0 +1,114 @@
+"""Import time of dodo.py, of the task generation and of every action module.
+
+    poetry run python -m benchmarks.startup --save
+    poetry run python -m benchmarks.startup --threshold 0.2
+
+Every import runs in a fresh interpreter, the fastest of `--repeat` runs counts.
+Besides the time, the heavy modules (those imported by the warm worker pool)
+which were imported along are listed, generating the tasks should need none.
+The results are compared with the saved baseline like by `benchmarks.stages`.
+"""
+
+import argparse
+import json
+import pkgutil
+import subprocess
+import sys
+from pathlib import Path
+
+import actions
+from actions import base_dir, pool
+
+default_baseline = base_dir / "_cache" / "benchmarks" / "startup.json"
+
+heavy_packages = sorted(
+    {name.split(".")[0] for name in pool.heavy_modules} - {"actions"}
+)
+
+# changes below this limit / s are noise
+MIN_TIME = 0.01
+
+script = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy}))
+print(json.dumps({{"time": elapsed, "heavy": heavy}}))
+"""
+
+
+def targets() -> dict:
+    "Returns a dict of name -> code to measure"
+    result = {
+        "dodo": "import dodo",
+        "dodo tasks": "import dodo\n"
+        "from doit.loader import load_tasks\n"
+        "load_tasks(vars(dodo))",
+    }
+    for module in pkgutil.iter_modules(actions.__path__):
+        result[f"actions.{module.name}"] = f"import actions.{module.name}"
+    return result
+
+
+def measure(code, repeat=3) -> dict:
+    "Returns the fastest time of running `code` in a fresh interpreter"
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script.format(code=code, heavy=heavy_packages)],
+            cwd=base_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return min(runs, key=lambda run: run["time"])
+
+
+def regressions(results, baseline, threshold):
+    "Yields the targets which got slower than the baseline by more than `threshold`"
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        old, new = previous["time"], current["time"]
+        if new > MIN_TIME and new > (1 + threshold) * old:
+            yield name, old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=default_baseline)
+    parser.add_argument("--save", action="store_true", help="save as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {name: measure(code, args.repeat) for name, code in targets().items()}
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print(f"{'import':<28} {'time':>9} {'change':>8}  heavy modules")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        change = f"{current['time'] / previous['time'] - 1:+.0%}" if previous else ""
+        print(
+            f"{name:<28} {current['time']:>7.3f} s {change:>8}  "
+            f"{', '.join(current['heavy'])}"
+        )
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    found = list(regressions(results, baseline, args.threshold))
+    for name, old, new in found:
+        print(f"Regression: import of {name} {old:.3f} s → {new:.3f} s")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
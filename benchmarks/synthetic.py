@@ -0,0 +1,42 @@
+"Synthetic LatticeJSON rings of scalable size"
+
+from math import pi
+
+CELL = ["Q1", "D1", "B1", "D1", "S1", "Q2", "S2", "D1", "B1", "D1", "Q1"]
+
+
+def ring(n_elements: int, n_sections=16) -> dict:
+    """Returns a ring of FODO cells with about `n_elements` elements in total.
+
+    The ring is made of up to `n_sections` identical sections. Every cell of a
+    section has its own element definitions, so the size of the lattice file
+    grows with the number of cells per section.
+    """
+    n_cells = max(round(n_elements / len(CELL)), 2)
+    n_sections = next(
+        n for n in range(min(n_sections, n_cells), 0, -1) if n_cells % n == 0
+    )
+    angle = 2 * pi / (2 * n_cells)
+    elements, lattices = {}, {}
+    for i in range(n_cells // n_sections):
+        elements.update(
+            {
+                f"D1_{i}": ["Drift", {"length": 0.55}],
+                f"Q1_{i}": ["Quadrupole", {"length": 0.2, "k1": 1.2}],
+                f"Q2_{i}": ["Quadrupole", {"length": 0.4, "k1": -1.2}],
+                f"S1_{i}": ["Sextupole", {"length": 0.1, "k2": 2.0}],
+                f"S2_{i}": ["Sextupole", {"length": 0.1, "k2": -2.0}],
+                f"B1_{i}": ["Dipole", {"length": 1.5, "angle": angle}],
+            }
+        )
+        lattices[f"CELL_{i}"] = [f"{name}_{i}" for name in CELL]
+    lattices["SECTION"] = list(lattices)
+    lattices["RING"] = ["SECTION"] * n_sections
+    return {
+        "version": "2.2",
+        "title": f"Synthetic ring of {n_cells} cells",
+        "info": "Generated by benchmarks/synthetic.py",
+        "root": "RING",
+        "elements": elements,
+        "lattices": lattices,
+    }
@@ -1,21 +1,58 @@
-from pathlib import Path
-
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def lattice_cache_dir(tmp_path, monkeypatch):
+    "Keep the pickles of the lattice cache out of the checkout"
+    from actions import lattice_cache
+
+    monkeypatch.setattr(lattice_cache, "cache_dir", tmp_path / "lattices")
+    return tmp_path / "lattices"
+
+
 @pytest.fixture(scope="session")
-def test_output_dir():
-    test_dir = Path(__file__).parent / "tests"
-    test_output_dir = test_dir / "results"
-    test_output_dir.mkdir(exist_ok=True)
-    return test_output_dir
+def test_output_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("results")
 
 
 @pytest.fixture(scope="session")
 def test_lattice():
-    # TODO: add test lattice
-    raise Exception("test is currently broken!")
+    "Info entry of the test lattice"
+    return {
+        "simulations": ["apace", "elegant", "madx"],
+        "energy": 1700,
+    }
+
+
+@pytest.fixture(scope="session")
+def test_lattice_path(tmp_path_factory):
+    "Path of the test lattice, a synthetic ring, in all formats (without suffix)"
+    import latticejson
+
+    from benchmarks.synthetic import ring
+
+    path = tmp_path_factory.mktemp("lattice") / "ring"
+    for suffix in (".json", ".lte", ".madx"):
+        latticejson.save(ring(88, n_sections=8), path.with_suffix(suffix))
+    return path
+
+
+@pytest.fixture
+def fodo_ring():
+    "LatticeJSON dict of a ring made of 8 identical FODO cells"
     return {
-        "simulation": ...,
-        "energy": ...,
+        "version": "2.2",
+        "title": "FODO ring",
+        "info": "Test lattice",
+        "root": "RING",
+        "elements": {
+            "D1": ["Drift", {"length": 0.55}],
+            "Q1": ["Quadrupole", {"length": 0.2, "k1": 1.2}],
+            "Q2": ["Quadrupole", {"length": 0.4, "k1": -1.2}],
+            "B1": ["Dipole", {"length": 1.5, "angle": 0.39269908169872414}],
+        },
+        "lattices": {
+            "CELL": ["Q1", "D1", "B1", "D1", "Q2", "D1", "B1", "D1", "Q1"],
+            "RING": ["CELL"] * 8,
+        },
     }
@@ -1,8 +1,20 @@
+import sys
+from collections import defaultdict
+from functools import lru_cache
 from operator import itemgetter
 from pathlib import Path
 
 import tomlkit
 
+from actions.dependencies import (
+    ReasonReporter,
+    code_changed,
+    fingerprint,
+    value_changed,
+)
+
+DOIT_CONFIG = {"reporter": ReasonReporter}
+
 base_dir = Path(__file__).parent
 config = tomlkit.loads((base_dir / "config.toml").read_text())
 
@@ -12,48 +24,251 @@ data_dir.mkdir(exist_ok=True)
 results_dir = base_dir / str(config["RESULTS_DIR"])
 results_dir.mkdir(exist_ok=True)
 
-info_files = list(data_dir.rglob("info.toml"))
-lattices_by_namespace = {
-    path.parent.stem: tomlkit.loads(path.read_text()) for path in info_files
+worker_pool = bool(config.get("WORKER_POOL", False))
+render_pool = bool(config.get("RENDER_POOL", False))
+use_result_store = bool(str(config.get("RESULT_STORE", "_cache/results")))
+
+# Python packages whose versions are part of the keys of the result store
+packages = ["numpy", "matplotlib", "latticejson"]
+simulation_packages = {
+    "apace": ["apace"],
+    "elegant": ["eleganttools"],
+    "madx": ["cpymad"],
 }
 
+index_path = base_dir / "_cache" / "info_index.json"
+
+
+def selected_namespaces():
+    "Returns the namespaces of the sub-tasks on the command line or None for all"
+    task_names = {
+        name[len("task_") :] for name in globals() if name.startswith("task_")
+    }
+    namespaces = set()
+    for arg in sys.argv[1:]:
+        task_name, _, sub_task = arg.partition(":")
+        if task_name in task_names:
+            if "/" not in sub_task:
+                return None
+            namespaces.add(sub_task.split("/")[0])
+    return namespaces or None
+
+
+@lru_cache(maxsize=None)
+def lattices_by_info_file():
+    "Returns a dict of info.toml path -> lattices, loaded lazily from the index"
+    from actions import info_index
+
+    info = info_index.load(data_dir, index_path, selected_namespaces())
+    for path, lattices in info.items():
+        for name, lattice in lattices.items():
+            lattice["namespace"] = path.parent.stem
+            lattice["name"] = name
+    return info
+
+
+def info_files():
+    return list(lattices_by_info_file())
+
+
+def lattices_all():
+    return [
+        lattice
+        for lattices in lattices_by_info_file().values()
+        for lattice in lattices.values()
+    ]
+
+
+def lattices_by_simulation(simulation):
+    return [
+        lattice for lattice in lattices_all() if simulation in lattice["simulations"]
+    ]
+
+
+def timed_action(action, args, task_name, kwargs=None):
+    "Returns a doit action which runs `action` as the timed task `task_name`"
+    from actions.timing import task
 
-lattices_all = []
-lattices_by_simulation = {}
-for namespace, lattices in lattices_by_namespace.items():
-    for name, lattice in lattices.items():
-        lattice["namespace"] = namespace
-        lattice["name"] = name
-        lattices_all.append(lattice)
-        for simulation in lattice["simulations"]:
-            try:
-                lattices_by_simulation[simulation].append(lattice)
-            except KeyError:
-                lattices_by_simulation[simulation] = [lattice]
+    return (task, (task_name, action.__module__, action.__name__, args, kwargs))
+
+
+def python_action(action, args, task_name):
+    "Like `timed_action`, but dispatched to the warm worker pool if enabled"
+    if worker_pool:
+        from actions.pool import run
+
+        timed = (task_name, action.__module__, action.__name__, args)
+        return (run, ("actions.timing", "task", timed))
+    return timed_action(action, args, task_name)
+
+
+def stored_action(action, inputs, values, targets):
+    """Returns `action` wrapped to link the `targets` from the result store if the
+    `inputs` files and the `values` are the same as of an earlier run.
+    """
+    if not use_result_store:
+        return action
+    from actions.result_store import run
+
+    return (run, (action, inputs, values, targets))
+
+
+def store_values(simulation, action, **values):
+    "Returns the values of the result store key of a task running `action`"
+    from actions.result_store import versions
+
+    return {
+        "code": fingerprint(action),
+        "versions": versions(*packages, *simulation_packages.get(simulation, [])),
+        **values,
+    }
+
+
+def parameters(lattice):
+    "Returns the values of the info entry which change the simulation results"
+    return {key: lattice.get(key) for key in ("energy", "periodic")}
+
+
+def stage_tasks(simulation, stage, action, targets, inputs):
+    """Yields the sub-tasks of a stage after the simulation, e.g. the tables.
+
+    `inputs(namespace, name)` returns the input files, which are passed to the
+    action followed by the output dir. The stage only depends on its own code.
+    The plots are rendered in the background if `RENDER_POOL` is enabled.
+    """
+    for lattice in lattices_by_simulation(simulation):
+        namespace, name = itemgetter("namespace", "name")(lattice)
+        output_dir = results_dir / namespace / name / simulation
+        file_dep = inputs(namespace, name)
+        target_paths = [output_dir / path for path in targets]
+        task_name = f"{simulation}_{stage}:{namespace}/{name}"
+        args = (*file_dep, output_dir)
+        # the render processes are warm already, so no worker pool for them
+        in_background = stage == "plots" and render_pool
+        run = timed_action if in_background else python_action
+        doit_action = stored_action(
+            run(action, args, task_name),
+            file_dep,
+            store_values(simulation, action),
+            target_paths,
+        )
+        if in_background:
+            from actions.render_pool import submit
+
+            doit_action = (submit, (task_name, doit_action, target_paths))
+        yield {
+            "name": f"{namespace}/{name}",
+            "actions": [doit_action],
+            "targets": target_paths,
+            "file_dep": file_dep,
+            "uptodate": [code_changed(action)],
+            "clean": True,
+        }
+
+
+def summary_tasks(simulation):
+    "Yields sub-tasks which group the tables and plots of a simulation code"
+    for lattice in lattices_by_simulation(simulation):
+        sub_task = "{namespace}/{name}".format(**lattice)
+        yield {
+            "name": sub_task,
+            "actions": None,
+            "task_dep": [
+                f"{simulation}_tables:{sub_task}",
+                f"{simulation}_plots:{sub_task}",
+            ],
+        }
+
+
+def scan_tasks(simulation):
+    "Yields the parameter scans declared in the info.toml files"
+    import importlib
+
+    from actions.scan import action, codes, target
+
+    model = importlib.import_module(codes[simulation]).ScanModel
+    for lattice in lattices_by_simulation(simulation):
+        if "scan" not in lattice:
+            continue
+        namespace, name = itemgetter("namespace", "name")(lattice)
+        lattice_path = (results_dir / namespace / name / name).with_suffix(
+            lattice_formats[simulation]
+        )
+        output_dir = results_dir / namespace / name / simulation
+        yield {
+            "name": f"{namespace}/{name}",
+            "actions": [
+                stored_action(
+                    # the scan runs its own process pool
+                    timed_action(
+                        action,
+                        (simulation, lattice, lattice_path, output_dir),
+                        f"{simulation}_scan:{namespace}/{name}",
+                    ),
+                    [lattice_path],
+                    store_values(
+                        simulation,
+                        action,
+                        model=fingerprint(model),
+                        parameters=parameters(lattice),
+                        scan=lattice["scan"],
+                    ),
+                    [output_dir / target],
+                )
+            ],
+            "targets": [output_dir / target],
+            "file_dep": [lattice_path],
+            "uptodate": [
+                code_changed(action, model),
+                value_changed("info entry", lattice),
+            ],
+            "clean": True,
+        }
+
+
+lattice_formats = {"apace": ".json", "elegant": ".lte", "madx": ".madx"}
+
+
+@lru_cache(maxsize=None)
+def source_files(namespace):
+    "Returns a dict of lattice name -> source file, from a single directory scan"
+    return {
+        path.stem: path
+        for path in (data_dir / namespace).iterdir()
+        if path.suffix in {".json", ".lte", ".madx"}
+    }
 
 
 def task_convert_lattices():
-    "Convert lattice files into different formats"
-    from actions.convert_lattices import __file__ as python_file
+    "Convert lattice files into the formats needed by the simulations"
     from actions.convert_lattices import action
 
-    for lattice in lattices_all:
+    for lattice in lattices_all():
         namespace, name = itemgetter("namespace", "name")(lattice)
-        source_dir = data_dir / namespace
-        # TODO: is there a better way?
-        source = next(source_dir.glob(f"{name}.*"))
+        try:
+            source = source_files(namespace)[name]
+        except KeyError:
+            raise FileNotFoundError(f"No lattice file for {namespace}/{name}") from None
         target_base = results_dir / namespace / name / name
         target_base.parent.mkdir(parents=True, exist_ok=True)
-        targets = [
-            target_base.with_suffix(".json"),
-            target_base.with_suffix(".lte"),
-            target_base.with_suffix(".madx"),
-        ]
+        # the lattice_info task always needs the json file
+        suffixes = {".json"}
+        suffixes.update(
+            lattice_formats[simulation]
+            for simulation in lattice["simulations"]
+            if simulation in lattice_formats
+        )
+        targets = [target_base.with_suffix(suffix) for suffix in sorted(suffixes)]
         yield {
-            "name": source,
-            "actions": [(action, [source, targets])],
+            "name": f"{namespace}/{name}",
+            "actions": [
+                timed_action(
+                    action, (source, targets), f"convert_lattices:{namespace}/{name}"
+                )
+            ],
             "targets": targets,
-            "file_dep": [python_file, source],
+            "file_dep": [source],
+            "uptodate": [code_changed(action)],
             "clean": True,
         }
 
@@ -69,9 +284,9 @@ def task_index_json():
     index_path = results_dir / "index.json"
     yield {
         "name": "index.json",
-        "actions": [(action, (index_path, lattices_all))],
+        "actions": [(action, (index_path, lattices_all()))],
         "targets": [index_path],
-        "file_dep": info_files,
+        "uptodate": [value_changed("info entries", lattices_all())],
     }
 
 
@@ -82,9 +297,8 @@ def task_index_json_per_lattice():
     def save_data(path, data):
         path.write_text(json.dumps(data))
 
-    for lattice in lattices_all:
+    for lattice in lattices_all():
         namespace, name = itemgetter("namespace", "name")(lattice)
-        info_file = data_dir / namespace / "info.toml"
         target = results_dir / namespace / name / "index.json"
         target.parent.mkdir(parents=True, exist_ok=True)
 
@@ -92,97 +306,335 @@ def task_index_json_per_lattice():
             "name": f"{namespace}/{name}",
             "actions": [(save_data, (target, lattice))],
             "targets": [target],
-            "file_dep": [info_file],
+            "uptodate": [value_changed("info entry", lattice)],
             "clean": True,
         }
 
 
 def task_lattice_info():
-    from actions.lattice_info import __file__ as python_file
     from actions.lattice_info import action, targets
 
-    for lattice in lattices_all:
+    for lattice in lattices_all():
         namespace, name = itemgetter("namespace", "name")(lattice)
         output_dir = results_dir / namespace / name
         lattice_path = (results_dir / namespace / name / name).with_suffix(".json")
+        target_paths = [output_dir / path for path in targets]
         yield {
             "name": f"{namespace}/{name}",
-            "actions": [(action, (lattice, lattice_path, output_dir))],
-            "targets": [output_dir / path for path in targets],
-            "file_dep": [python_file, lattice_path],
+            "actions": [
+                stored_action(
+                    python_action(
+                        action,
+                        (lattice, lattice_path, output_dir),
+                        f"lattice_info:{namespace}/{name}",
+                    ),
+                    [lattice_path],
+                    store_values(None, action, parameters=parameters(lattice)),
+                    target_paths,
+                )
+            ],
+            "targets": target_paths,
+            "file_dep": [lattice_path],
+            "uptodate": [code_changed(action), value_changed("info entry", lattice)],
             "clean": True,
         }
 
 
-def task_apace_summary():
-    "Generate lattice summaries using apace"
-    from actions.twiss_apace import __file__ as python_file
-    from actions.twiss_apace import action, targets
+def task_apace_simulation():
+    from actions.twiss_apace import simulation_action, simulation_apace_dir
 
-    for lattice in lattices_by_simulation["apace"]:
+    for lattice in lattices_by_simulation("apace"):
         namespace, name = itemgetter("namespace", "name")(lattice)
         lattice_path = (results_dir / namespace / name / name).with_suffix(".json")
-        output_dir = results_dir / namespace / name / "apace"
-        # TODO: what does clean do??
+        target = (simulation_apace_dir / namespace / name).with_suffix(".pickle")
         yield {
             "name": f"{namespace}/{name}",
-            "actions": [(action, (lattice, lattice_path, output_dir))],
-            "targets": [output_dir / path for path in targets],
-            "file_dep": [python_file, lattice_path],
+            "actions": [
+                stored_action(
+                    python_action(
+                        simulation_action,
+                        (lattice, lattice_path, target),
+                        f"apace_simulation:{namespace}/{name}",
+                    ),
+                    [lattice_path],
+                    store_values(
+                        "apace", simulation_action, parameters=parameters(lattice)
+                    ),
+                    [target],
+                )
+            ],
+            "targets": [target],
+            "file_dep": [lattice_path],
+            "uptodate": [
+                code_changed(simulation_action),
+                value_changed("parameters", parameters(lattice)),
+            ],
             "clean": True,
         }
 
 
-def task_elegant_twiss_simulation():
-    from actions import config_dir
-    from actions.twiss_elegant import simulation_elegant_dir
+def task_apace_tables():
+    from actions.twiss_apace import simulation_apace_dir, table_targets, tables_action
+
+    def inputs(namespace, name):
+        return [(simulation_apace_dir / namespace / name).with_suffix(".pickle")]
+
+    yield from stage_tasks("apace", "tables", tables_action, table_targets, inputs)
+
+
+def task_apace_plots():
+    from actions.twiss_apace import plot_targets, plots_action, simulation_apace_dir
+
+    def inputs(namespace, name):
+        return [
+            (simulation_apace_dir / namespace / name).with_suffix(".pickle"),
+            (results_dir / namespace / name / name).with_suffix(".json"),
+        ]
+
+    yield from stage_tasks("apace", "plots", plots_action, plot_targets, inputs)
+
+
+def task_apace_scan():
+    "Run the parameter scans of the lattices using apace"
+    yield from scan_tasks("apace")
+
+
+def task_apace_summary():
+    "Generate lattice summaries using apace"
+    yield from summary_tasks("apace")
+
 
-    for lattice in lattices_by_simulation["elegant"]:
+def task_elegant_twiss_simulation():
+    from shlex import join
+
+    from actions.result_store import executable_version
+    from actions.scheduler import run
+    from actions.twiss_elegant import (
+        run_command,
+        run_file,
+        run_macros,
+        simulation_elegant_dir,
+    )
+
+    executable = str(config.get("ELEGANT", "elegant"))
+    scheduler_options = {
+        "concurrency": int(config.get("SIMULATION_CONCURRENCY", 0)),
+        "timeout": config.get("SIMULATION_TIMEOUT"),
+        "retries": int(config.get("SIMULATION_RETRIES", 0)),
+    }
+    for lattice in lattices_by_simulation("elegant"):
         namespace, name, energy = itemgetter("namespace", "name", "energy")(lattice)
-        run_file = config_dir / "twiss.ele"
         lattice_path = (results_dir / namespace / name / name).with_suffix(".lte")
         target = (simulation_elegant_dir / namespace / name).with_suffix(".twi")
         target.parent.mkdir(parents=True, exist_ok=True)
+        command = run_command(
+            lattice_path, energy, target, lattice.get("profile"), executable
+        )
+        values = store_values(
+            "elegant",
+            run,
+            energy=energy,
+            macros=run_macros(lattice.get("profile")),
+            elegant=executable_version(executable),
+        )
         yield {
             "name": f"{namespace}/{name}",
             "actions": [
-                f"elegant {run_file} -macro=energy={energy},lattice={lattice_path},filename={target} > /dev/null"
+                stored_action(
+                    timed_action(
+                        run,
+                        (command, target.with_suffix(".log")),
+                        f"elegant_twiss_simulation:{namespace}/{name}",
+                        scheduler_options,
+                    ),
+                    [run_file, lattice_path],
+                    values,
+                    [target],
+                )
             ],
             "targets": [target],
             "file_dep": [run_file, lattice_path],
+            # re-run when the energy or the simulation profile changes
+            "uptodate": [value_changed("command", join(command))],
             "clean": True,
         }
 
 
+def task_elegant_tables():
+    from actions.twiss_elegant import (
+        simulation_elegant_dir,
+        table_targets,
+        tables_action,
+    )
+
+    def inputs(namespace, name):
+        return [(simulation_elegant_dir / namespace / name).with_suffix(".twi")]
+
+    yield from stage_tasks("elegant", "tables", tables_action, table_targets, inputs)
+
+
+def task_elegant_plots():
+    from actions.twiss_elegant import plot_targets, plots_action, simulation_elegant_dir
+
+    def inputs(namespace, name):
+        return [(simulation_elegant_dir / namespace / name).with_suffix(".twi")]
+
+    yield from stage_tasks("elegant", "plots", plots_action, plot_targets, inputs)
+
+
 def task_elegant_summary():
-    from actions.twiss_elegant import __file__ as python_file
-    from actions.twiss_elegant import action, simulation_elegant_dir, targets
+    "Generate lattice summaries using elegant"
+    yield from summary_tasks("elegant")
+
 
-    for lattice in lattices_by_simulation["elegant"]:
+def task_madx_simulation():
+    from actions.twiss_madx import simulation_action, simulation_madx_dir
+
+    for lattice in lattices_by_simulation("madx"):
         namespace, name = itemgetter("namespace", "name")(lattice)
-        output_dir = results_dir / namespace / name / "elegant"
-        twi_data_path = (simulation_elegant_dir / namespace / name).with_suffix(".twi")
+        lattice_path = (results_dir / namespace / name / name).with_suffix(".madx")
+        target = (simulation_madx_dir / namespace / name).with_suffix(".pickle")
         yield {
             "name": f"{namespace}/{name}",
-            "actions": [(action, (twi_data_path, output_dir))],
-            "targets": [output_dir / path for path in targets],
-            "file_dep": [python_file, twi_data_path],
+            "actions": [
+                stored_action(
+                    python_action(
+                        simulation_action,
+                        (lattice, lattice_path, target),
+                        f"madx_simulation:{namespace}/{name}",
+                    ),
+                    [lattice_path],
+                    store_values(
+                        "madx", simulation_action, parameters=parameters(lattice)
+                    ),
+                    [target],
+                )
+            ],
+            "targets": [target],
+            "file_dep": [lattice_path],
+            "uptodate": [
+                code_changed(simulation_action),
+                value_changed("parameters", parameters(lattice)),
+            ],
             "clean": True,
         }
 
 
+def task_madx_tables():
+    from actions.twiss_madx import simulation_madx_dir, table_targets, tables_action
+
+    def inputs(namespace, name):
+        return [(simulation_madx_dir / namespace / name).with_suffix(".pickle")]
+
+    yield from stage_tasks("madx", "tables", tables_action, table_targets, inputs)
+
+
+def task_madx_plots():
+    from actions.twiss_madx import plot_targets, plots_action, simulation_madx_dir
+
+    def inputs(namespace, name):
+        return [(simulation_madx_dir / namespace / name).with_suffix(".pickle")]
+
+    yield from stage_tasks("madx", "plots", plots_action, plot_targets, inputs)
+
+
+def task_madx_scan():
+    "Run the parameter scans of the lattices using MAD-X"
+    yield from scan_tasks("madx")
+
+
 def task_madx_summary():
-    from actions.twiss_madx import __file__ as python_file
-    from actions.twiss_madx import action, targets
+    "Generate lattice summaries using MAD-X"
+    yield from summary_tasks("madx")
+
 
-    for lattice in lattices_by_simulation["madx"]:
+def summary_tables():
+    "Returns a dict of namespace -> lattice name -> code -> path of the tables"
+    namespaces = defaultdict(dict)
+    for lattice in lattices_all():
         namespace, name = itemgetter("namespace", "name")(lattice)
-        lattice_path = (results_dir / namespace / name / name).with_suffix(".madx")
-        output_dir = results_dir / namespace / name / "madx"
+        lattice_dir = results_dir / namespace / name
+        namespaces[namespace][name] = {
+            "lattice_info": lattice_dir / "lattice_info.json",
+            **{
+                simulation: lattice_dir / simulation / "twiss_tables.json"
+                for simulation in lattice["simulations"]
+                if simulation in lattice_formats
+            },
+        }
+    return namespaces
+
+
+def task_comparison():
+    "Merge the summary tables into one comparison shard per namespace"
+    from actions.comparison import suffixes, update
+
+    for namespace, sources in summary_tables().items():
+        shard_dir = results_dir / "comparison"
+        yield {
+            "name": namespace,
+            "actions": [
+                (update, (shard_dir / f"{namespace}.json", namespace, sources))
+            ],
+            "targets": [shard_dir / f"{namespace}{suffix}" for suffix in suffixes],
+            "file_dep": [path for paths in sources.values() for path in paths.values()],
+            "uptodate": [code_changed(update), value_changed("sources", sources)],
+            "clean": True,
+        }
+
+
+def task_metrics_db():
+    "Load the metrics of all summaries into an indexed SQLite database"
+    from actions.metrics_db import build, db_path
+
+    sources = summary_tables()
+    yield {
+        "name": db_path.name,
+        "actions": [(build, (db_path, sources))],
+        "targets": [db_path],
+        "file_dep": [
+            path
+            for lattices in sources.values()
+            for paths in lattices.values()
+            for path in paths.values()
+        ],
+        "uptodate": [code_changed(build), value_changed("sources", sources)],
+        "clean": True,
+    }
+
+
+def task_code_comparison():
+    "Compare the optics and tables of the simulation codes for every lattice"
+    from actions.code_comparison import action, codes, targets
+    from actions.optics_export import target
+
+    for lattice in lattices_all():
+        simulations = [code for code in codes if code in lattice["simulations"]]
+        if len(simulations) < 2:
+            continue
+        namespace, name = itemgetter("namespace", "name")(lattice)
+        lattice_dir = results_dir / namespace / name
+        sources = {
+            code: (
+                lattice_dir / code / target,
+                lattice_dir / code / "twiss_tables.json",
+            )
+            for code in simulations
+        }
+        task_name = f"code_comparison:{namespace}/{name}"
+        target_paths = [lattice_dir / path for path in targets]
+        if render_pool:  # most of the time is spent on the plot
+            from actions.render_pool import submit
+
+            doit_action = timed_action(action, (sources, lattice_dir), task_name)
+            doit_action = (submit, (task_name, doit_action, target_paths))
+        else:
+            doit_action = python_action(action, (sources, lattice_dir), task_name)
         yield {
             "name": f"{namespace}/{name}",
-            "actions": [(action, (lattice, lattice_path, output_dir))],
-            "targets": [output_dir / path for path in targets],
-            "file_dep": [python_file, lattice_path],
+            "actions": [doit_action],
+            "targets": target_paths,
+            "file_dep": [path for paths in sources.values() for path in paths],
+            "uptodate": [code_changed(action), value_changed("sources", sources)],
             "clean": True,
         }
@@ -1,4 +1,19 @@
-def test_results(test_lattice, test_output_dir):
-    from scripts.twiss_apace import action
+import pytest
 
-    action(test_lattice, test_output_dir / "apace")
+
+def test_results(test_lattice, test_lattice_path, test_output_dir):
+    pytest.importorskip("apace")
+    from actions.twiss_apace import (
+        plots_action,
+        simulation_action,
+        tables_action,
+        targets,
+    )
+
+    lattice_path = test_lattice_path.with_suffix(".json")
+    result_path = test_output_dir / "apace.pickle"
+    output_dir = test_output_dir / "apace"
+    simulation_action(test_lattice, lattice_path, result_path)
+    tables_action(result_path, output_dir)
+    plots_action(result_path, lattice_path, output_dir)
+    assert all((output_dir / target).exists() for target in targets)
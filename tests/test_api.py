@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+
+def test_info_table(fodo_ring, tmp_path):
+    import latticejson
+
+    from actions import api, lattice_info
+
+    lattice_path = tmp_path / "fodo.json"
+    latticejson.save(fodo_ring, lattice_path)
+    lattice_info.action({"energy": 1700}, lattice_path, tmp_path)
+    expected = json.loads((tmp_path / lattice_info.targets[0]).read_text())
+    assert json.loads(json.dumps(api.info_table(fodo_ring, 1700))) == expected
+
+
+def test_madx(fodo_ring):
+    pytest.importorskip("cpymad")
+    from actions import api
+
+    metrics = api.metrics(fodo_ring, 1700, codes=["madx"])
+    assert set(metrics) == {"lattice_info", "madx"}
+    periodic = api.metrics(fodo_ring, 1700, codes=["madx"], periodic=True)
+    assert periodic["madx"]["tune x"] == pytest.approx(metrics["madx"]["tune x"])
+
+    stronger = json.loads(json.dumps(fodo_ring))
+    stronger["elements"]["Q1"][1]["k1"] = 1.3
+    results = api.batch([fodo_ring, stronger], 1700, codes=["madx"])
+    assert results[0] == metrics
+    assert results[1]["madx"]["tune x"] > metrics["madx"]["tune x"]
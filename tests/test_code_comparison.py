@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+
+from actions import code_comparison, optics_export, tables
+
+
+def test_resample():
+    s = np.array([0.0, 1.0, 1.0, 3.0])  # zero-length element at s = 1
+    stacked = np.array([[0.0, 1.0, 1.0, 5.0], [2.0, 2.0, 4.0, 4.0]])
+    result = code_comparison.resample(s, stacked, np.array([0.0, 0.5, 2.0, 3.0]))
+    assert np.allclose(result, [[0.0, 0.5, 3.0, 5.0], [2.0, 2.0, 4.0, 4.0]])
+    assert np.allclose(result[0], np.interp([0.0, 0.5, 2.0, 3.0], s, stacked[0]))
+
+
+def test_action(tmp_path):
+    sources = {}
+    # the madx positions (element ends) are among the apace positions (slice ends)
+    for code, n_points, offset, tune in [
+        ("madx", 51, 0.0, 2.0),
+        ("apace", 201, 0.001, 2.01),
+    ]:
+        s = np.linspace(0, 10, n_points)
+        optics = {"s": s, "beta_x": 5 + np.sin(s) + offset, "beta_y": 5 + np.cos(s)}
+        if code == "madx":
+            optics["eta_x"] = np.zeros_like(s)
+        paths = tmp_path / f"{code}.npz", tmp_path / f"{code}.json"
+        optics_export.save(paths[0], optics)
+        paths[1].write_text(json.dumps([["Tunes", [[["tune x", tune], ["Qₓ", tune]]]]]))
+        sources[code] = paths
+
+    code_comparison.action(sources, tmp_path / "output")
+    result = json.loads((tmp_path / "output" / code_comparison.targets[0]).read_text())
+    assert result[0][0] == "apace vs. madx"
+    values = tables.values(result)
+    # compared at the madx positions, no interpolation error of the coarse madx
+    assert np.isclose(values["max |Δβₓ| / m"], 0.001)
+    assert np.isclose(values["rms Δβₓ / m"], 0.001)
+    assert values["max |Δβᵧ| / m"] < 1e-12
+    assert "max |Δηₓ| / m" not in values
+    assert np.isclose(values["ΔQₓ / Qₓ"], 0.005)
+    assert (tmp_path / "output" / code_comparison.targets[1]).exists()
@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+
+from actions import comparison
+
+madx_tables = [["Optical Functions", ["twiss.svg"]], ["Tunes", [[["tune x", 1.9]]]]]
+info_tables = ["Lattice Info", [["Energy / MeV", 1700], ["Circumference / m", 48.0]]]
+
+
+def write(path, data, age=10):
+    "Write `data` as json, modified `age` seconds ago"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+    mtime = path.stat().st_mtime_ns - age * 1_000_000_000
+    os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+def test_update(tmp_path):
+    sources = {
+        name: {
+            "lattice_info": write(tmp_path / name / "lattice_info.json", info_tables),
+            "madx": write(tmp_path / name / "twiss_tables.json", madx_tables),
+        }
+        for name in ("b", "a")
+    }
+    del sources["b"]["madx"]
+    shard_path = tmp_path / "comparison" / "test.json"
+    comparison.update(shard_path, "test", sources)
+
+    data = json.loads(shard_path.read_text())
+    assert data["lattices"] == ["a", "b"]
+    assert data["columns"]["madx"] == {"tune x": [1.9, None]}
+    assert data["columns"]["lattice_info"]["Energy / MeV"] == [1700, 1700]
+    gz_path = shard_path.with_name("test.json.gz")
+    assert json.loads(gzip.decompress(gz_path.read_bytes())) == data
+    assert comparison.rows(data)["b"] == {
+        "lattice_info": {"Energy / MeV": 1700, "Circumference / m": 48.0}
+    }
+
+    # a lattice is added and the tables of another one change in the same run,
+    # the energy keeps the size of the file
+    sources["c"] = {"madx": write(tmp_path / "c" / "twiss_tables.json", madx_tables)}
+    write(sources["b"]["lattice_info"], json.loads(json.dumps(info_tables)))
+    info_path = sources["b"]["lattice_info"]
+    info_path.write_text(info_path.read_text().replace("1700", "2500"))
+    comparison.update(shard_path, "test", sources)
+    data = json.loads(shard_path.read_text())
+    assert data["lattices"] == ["a", "b", "c"]
+    assert data["columns"]["lattice_info"]["Energy / MeV"] == [1700, 2500, None]
+    assert data["columns"]["madx"] == {"tune x": [1.9, None, 1.9]}
+
+
+def test_update_reuses_unchanged_rows(tmp_path):
+    path = write(tmp_path / "a" / "twiss_tables.json", madx_tables)
+    sources = {"a": {"madx": path}}
+    shard_path = tmp_path / "comparison" / "test.json"
+    comparison.update(shard_path, "test", sources)
+
+    # same modification time and size: the rows of the shard are reused
+    stat = path.stat()
+    path.write_text(path.read_text().replace("1.9", "2.1"))
+    os.utime(path, ns=(stat.st_mtime_ns, stat.st_mtime_ns))
+    comparison.update(shard_path, "test", sources)
+    data = json.loads(shard_path.read_text())
+    assert data["columns"]["madx"] == {"tune x": [1.9]}
+
+    # unless the code reading the tables changed
+    shard_path.write_text(json.dumps({**data, "reader": "other"}))
+    comparison.update(shard_path, "test", sources)
+    data = json.loads(shard_path.read_text())
+    assert data["columns"]["madx"] == {"tune x": [2.1]}
@@ -0,0 +1,96 @@
+import sys
+import types
+
+from actions.dependencies import fingerprint, value_changed
+
+source = """
+labels = ["tune x", "tune y"]
+
+
+def helper(x):
+    return 2 * x
+
+
+def tables(data):
+    return [[label, helper(data)] for label in labels]
+
+
+def plots(data):
+    return data
+"""
+
+
+def load_module(source, name="actions._fingerprint_test"):
+    module = types.ModuleType(name)
+    sys.modules[name] = module
+    exec(compile(source, name, "exec"), module.__dict__)
+    return module
+
+
+def test_fingerprint():
+    module = load_module(source)
+    tables, plots = fingerprint(module.tables), fingerprint(module.plots)
+
+    # moving code around does not matter
+    moved = load_module("\n\n" + source)
+    assert fingerprint(moved.tables) == tables
+
+    # changes of used constants and called functions do
+    relabeled = load_module(source.replace('"tune x"', '"Tune x"'))
+    assert fingerprint(relabeled.tables) != tables
+    assert fingerprint(relabeled.plots) == plots
+    rescaled = load_module(source.replace("2 * x", "3 * x"))
+    assert fingerprint(rescaled.tables) != tables
+
+
+def test_value_changed():
+    class Task:
+        name = "task"
+        value_savers = []
+
+    check = value_changed("info entry", {"energy": 1700, "name": "ring"})
+    check.configure_task(Task)
+    saved = Task.value_savers[0]()
+    assert not check(Task, {})
+    assert check(Task, saved)
+    other = value_changed("info entry", {"name": "ring", "energy": 1800})
+    assert not other(Task, saved)
+
+
+def test_fingerprint_independent_of_checkout(tmp_path):
+    import shutil
+    import subprocess
+    from pathlib import Path
+
+    root = Path(__file__).parent.parent
+    code = (
+        "from actions import twiss_madx\n"
+        "from actions.dependencies import fingerprint\n"
+        "print(fingerprint(twiss_madx.simulation_action))"
+    )
+    digests = []
+    for checkout in (tmp_path / "a", tmp_path / "checkout_b"):
+        shutil.copytree(root / "actions", checkout / "actions")
+        shutil.copy(root / "config.toml", checkout)
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=checkout,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        digests.append(output.split()[-1])
+    assert digests[0] == digests[1]
+
+
+def test_elegant_plots_independent_of_tables():
+    import inspect
+
+    from actions import twiss_elegant
+
+    name = "actions._twiss_elegant_test"
+    source = inspect.getsource(twiss_elegant)
+    original = load_module(source, name)
+    relabeled = load_module(source.replace('"Qₓ"', '"Tune x"'), name)
+    assert fingerprint(relabeled.tables_action) != fingerprint(original.tables_action)
+    assert fingerprint(relabeled.plots_action) == fingerprint(original.plots_action)
@@ -1,4 +1,39 @@
-def test_results(test_lattice, test_output_dir):
-    from scripts.twiss_elegant import results
+import shutil
 
-    results(test_lattice, test_output_dir / "elegant")
+import pytest
+
+
+def test_results(test_lattice, test_lattice_path, test_output_dir):
+    pytest.importorskip("eleganttools")
+    if shutil.which("elegant") is None:
+        pytest.skip("elegant is not installed")
+    from actions.scheduler import run
+    from actions.twiss_elegant import plots_action, run_command, tables_action, targets
+
+    twiss_path = test_output_dir / "ring.twi"
+    output_dir = test_output_dir / "elegant"
+    lattice_path = test_lattice_path.with_suffix(".lte")
+    command = run_command(lattice_path, test_lattice["energy"], twiss_path)
+    assert run(command, twiss_path.with_suffix(".log"))
+    tables_action(twiss_path, output_dir)
+    plots_action(twiss_path, output_dir)
+    assert all((output_dir / target).exists() for target in targets)
+
+
+def test_run_macros():
+    pytest.importorskip("eleganttools")
+    from actions.twiss_elegant import run_macros
+
+    macros = run_macros("reference")
+    assert macros["drift_slice"] == 0.03
+    assert macros["higher_order_chromaticity"] == 1
+    assert macros["compute_driving_terms"] == 0
+
+
+def test_tolerance_violations():
+    from actions.twiss_elegant import tolerance_violations
+
+    reference = {"nux": 2.5, "nuy": 1.5, "dnux/dp": -2.0, "dnuy/dp": -4.0}
+    assert tolerance_violations(reference, dict(reference)) == {}
+    coarse = {**reference, "nux": 2.50001, "dnuy/dp": -4.2}
+    assert set(tolerance_violations(reference, coarse)) == {"dnuy/dp"}
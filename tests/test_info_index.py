@@ -0,0 +1,25 @@
+def test_load(tmp_path):
+    from actions.info_index import load
+
+    data_dir, index_path = tmp_path / "data", tmp_path / "index.json"
+    for namespace in "ab":
+        (data_dir / namespace).mkdir(parents=True)
+        (data_dir / namespace / "info.toml").write_text(
+            f'[lattice_{namespace}]\nenergy = 1700\nsimulations = ["apace"]\n'
+        )
+
+    info = load(data_dir, index_path)
+    assert {path.parent.name for path in info} == {"a", "b"}
+    assert info[data_dir / "a" / "info.toml"]["lattice_a"]["energy"] == 1700
+    assert index_path.exists()
+
+    # only the selected namespace is read
+    (data_dir / "a" / "info.toml").write_text("[changed]\nenergy = 2500\n")
+    info = load(data_dir, index_path, {"b"})
+    assert list(info) == [data_dir / "b" / "info.toml"]
+
+    info = load(data_dir, index_path)
+    assert info[data_dir / "a" / "info.toml"] == {"changed": {"energy": 2500}}
+
+    (data_dir / "b" / "info.toml").unlink()
+    assert list(load(data_dir, index_path)) == [data_dir / "a" / "info.toml"]
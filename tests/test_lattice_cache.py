@@ -0,0 +1,21 @@
+import json
+
+
+def test_cache(fodo_ring, tmp_path, monkeypatch):
+    from actions import lattice_cache
+
+    monkeypatch.setattr(lattice_cache, "cache_dir", tmp_path / "cache")
+    lattice_path = tmp_path / "lattice.json"
+    lattice_path.write_text(json.dumps(fodo_ring))
+
+    assert len(lattice_cache.flattened(lattice_path)) == 8 * 9
+    assert (
+        lattice_cache.flattened(lattice_path, "CELL") == fodo_ring["lattices"]["CELL"]
+    )
+    assert len(list((tmp_path / "cache").glob("*.pickle"))) == 3
+    # a cache hit must return an equal but independent object
+    first, second = lattice_cache.load(lattice_path), lattice_cache.load(lattice_path)
+    assert first == second and first is not second
+
+    lattice_cache.prune(max_size=0)
+    assert not list((tmp_path / "cache").glob("*.pickle"))
@@ -1,4 +1,36 @@
-def test_results(test_lattice, test_output_dir):
-    from scripts.lattice_info import results
+import json
 
-    results(test_lattice, test_output_dir / "lattice_info")
+import pytest
+
+
+def test_results(test_lattice, test_lattice_path, test_output_dir):
+    from actions.lattice_info import action, targets
+
+    output_dir = test_output_dir / "lattice_info"
+    action(test_lattice, test_lattice_path.with_suffix(".json"), output_dir)
+    name, table = json.loads((output_dir / targets[0]).read_text())
+    values = dict(table)
+    assert values["Fully symmetric"] == 1
+    assert values["Number of sections"] == 8
+
+
+def test_structure_totals(fodo_ring):
+    from latticejson.utils import flattened_element_sequence
+
+    from actions.lattice_info import BENDS, COUNT, LENGTH, structure_totals
+
+    fodo_ring["lattices"]["RING"][0] = "ARC"
+    fodo_ring["lattices"]["ARC"] = ["CELL", "D1", "CELL"]
+    fodo_ring["elements"]["B2"] = ["Dipole", {"length": 0.5, "angle": -0.1}]
+    fodo_ring["lattices"]["CELL"].append("B2")
+    types, totals = structure_totals(fodo_ring)
+    ring = totals["RING"]
+
+    elements = fodo_ring["elements"]
+    flat = list(flattened_element_sequence(fodo_ring))
+    length = sum(elements[name][1]["length"] for name in flat)
+    assert ring[LENGTH].sum() == pytest.approx(length)
+    for type_, count in zip(types, ring[COUNT]):
+        assert count == sum(elements[name][0] == type_ for name in flat)
+    assert ring[BENDS].sum() == 2 * 9
+    assert totals["CELL"][:, types.index("Dipole")].tolist() == [3, 3.5, 2, 1]
@@ -1,4 +1,30 @@
-def test_results(test_lattice, test_output_dir):
-    from scripts.twiss_madx import results
+import pytest
 
-    results(test_lattice, test_output_dir / "madx")
+
+def test_results(test_lattice, test_lattice_path, test_output_dir):
+    pytest.importorskip("cpymad")
+    from actions.twiss_madx import (
+        plots_action,
+        simulation_action,
+        tables_action,
+        targets,
+    )
+
+    result_path = test_output_dir / "madx.pickle"
+    output_dir = test_output_dir / "madx"
+    simulation_action(test_lattice, test_lattice_path.with_suffix(".madx"), result_path)
+    tables_action(result_path, output_dir)
+    plots_action(result_path, output_dir)
+    assert all((output_dir / target).exists() for target in targets)
+
+
+def test_periodic(fodo_ring, tmp_path):
+    pytest.importorskip("cpymad")
+    import latticejson
+
+    from actions.twiss_madx import check_periodic
+
+    lattice_path = tmp_path / "fodo.madx"
+    latticejson.save(fodo_ring, lattice_path)
+    deviations = check_periodic({"energy": 1700}, lattice_path)
+    assert max(deviations.values()) < 1e-8
@@ -0,0 +1,34 @@
+import pytest
+
+
+def test_reuse_and_reset():
+    pytest.importorskip("cpymad")
+    from actions import madx_pool
+
+    madx_pool.clear()
+    with madx_pool.instance() as madx:
+        madx.input("q: quadrupole, l=1, k1=0.5; ring: line=(q);")
+        madx.command.beam()
+        madx.use(sequence="ring")
+        first = madx
+    with madx_pool.instance() as madx:
+        assert madx is first
+        assert not list(madx.sequence)
+        madx.input("leaked_variable = 1;")
+    with madx_pool.instance() as madx:
+        assert madx is not first  # recycled because of the leaked global
+    madx_pool.clear()
+
+
+def test_recycle_on_error():
+    pytest.importorskip("cpymad")
+    from actions import madx_pool
+
+    madx_pool.clear()
+    with pytest.raises(RuntimeError):
+        with madx_pool.instance() as madx:
+            failed = madx
+            raise RuntimeError
+    with madx_pool.instance() as madx:
+        assert madx is not failed
+    madx_pool.clear()
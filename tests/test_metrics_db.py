@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from actions import metrics_db
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+    return path
+
+
+def test_metric_key():
+    key = metrics_db.metric_key
+    assert key("max beta x") == key("βₓ,ₘₐₓ / m") == "beta_x_max"
+    assert key("Number of Dipole elements") == "n_dipole"
+    assert key("Quadrupole length fraction") == "quadrupole_length_fraction"
+    assert key("Some New Value / m") == "some_new_value_m"
+
+
+def test_build_and_query(tmp_path):
+    db = tmp_path / "metrics.sqlite"
+    info = lambda length: ["Lattice Info", [["Circumference / m", length]]]
+    sources = {
+        "test": {
+            "a": {
+                "lattice_info": write(tmp_path / "a" / "info.json", info(48.0)),
+                "madx": write(tmp_path / "a" / "madx.json", [["tune x", 1.9]]),
+            },
+            "b": {
+                "lattice_info": write(tmp_path / "b" / "info.json", info(96.0)),
+                "apace": write(tmp_path / "b" / "apace.json", [["Qₓ", 2.1]]),
+            },
+        }
+    }
+    metrics_db.build(db, sources)
+
+    results = metrics_db.query(["tune_x > 2"], path=db)
+    assert results == [
+        {
+            "namespace": "test",
+            "name": "b",
+            "metrics": {"tune_x": {"apace": 2.1}},
+        }
+    ]
+    names = [r["name"] for r in metrics_db.query(["madx.tune_x > 1"], path=db)]
+    assert names == ["a"]
+    results = metrics_db.query(["circumference < 100"], ["tune_x"], path=db)
+    assert [r["name"] for r in results] == ["a", "b"]
+    assert results[0]["metrics"]["tune_x"] == {"madx": 1.9}
+    assert metrics_db.query(["unknown_key > 0"], path=db) == []
+    assert "circumference" in metrics_db.keys(db)
+    with pytest.raises(ValueError):
+        metrics_db.query(["tune_x is large"], path=db)
+
+    # unchanged files are not read again, removed lattices are deleted
+    path = sources["test"]["a"]["madx"]
+    stat = path.stat()
+    path.write_text("x" * stat.st_size)  # would fail to load
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    del sources["test"]["b"]
+    metrics_db.build(db, sources)
+    assert [r["name"] for r in metrics_db.query([], path=db)] == ["a"]
+
+    write(path, [["tune x", 2.5]])
+    metrics_db.build(db, sources)
+    names = [r["name"] for r in metrics_db.query(["tune_x > 2"], path=db)]
+    assert names == ["a"]
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from actions import optics_export
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / optics_export.target
+    s = np.linspace(0, 10, 1001)
+    optics_export.save(path, {"s": s, "beta_x": np.cos(s) + 2, "eta_x": s[::-1]})
+
+    data = optics_export.load(path, ["s", "eta_x"])
+    assert data.keys() == {"s", "eta_x"}
+    assert isinstance(data["s"], np.memmap)
+    assert np.array_equal(data["s"], s)
+    assert np.array_equal(data["eta_x"], s[::-1])
+    assert np.array_equal(np.load(path)["beta_x"], np.cos(s) + 2)
+
+
+def test_schema(tmp_path):
+    with pytest.raises(ValueError, match="betx"):
+        optics_export.save(tmp_path / "optics.npz", {"s": [0, 1], "betx": [1, 2]})
+    with pytest.raises(ValueError, match="same length"):
+        optics_export.save(tmp_path / "optics.npz", {"s": [0, 1], "beta_x": [1]})
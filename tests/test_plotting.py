@@ -0,0 +1,82 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
+
+from actions.plotting import decimate, render
+
+
+def test_decimate_keeps_peaks():
+    x = np.linspace(0, 100, 100_001)
+    y = np.sin(x) + (x == 50.0) * 10  # single sample spike
+    x_dec, y_dec = decimate(x, y, budget=500)
+    assert len(x_dec) <= 2 * 500 + 2
+    assert np.all(np.diff(x_dec) >= 0)
+    assert y_dec.max() == y.max() and y_dec.min() == y.min()
+    assert x_dec[0] == x[0] and x_dec[-1] == x[-1]
+
+
+def test_decimate_crops_to_range():
+    x = np.arange(1001) / 10
+    x_dec, y_dec = decimate(x, 2 * x, budget=None, x_range=(10.05, 19.95))
+    assert x_dec[0] == 10.0 and x_dec[-1] == 20.0
+    assert np.array_equal(y_dec, 2 * x_dec)
+
+
+def test_render_report(tmp_path):
+    def plot(n, budget=100):
+        x = np.linspace(0, 1, n)
+        fig = Figure()
+        fig.subplots().plot(*decimate(x, np.sin(50 * x), budget=budget))
+        return fig
+
+    report = {}
+    render(tmp_path / "plot.svg", plot, 100_000, report=report)
+    entry = report["plot.svg"]
+    assert entry["bytes"] == (tmp_path / "plot.svg").stat().st_size
+    assert entry["bytes"] < entry["bytes_full"]
+
+
+def test_render_releases_figures(tmp_path):
+    def plot():
+        fig, ax = plt.subplots()  # also pyplot figures of third-party code
+        ax.plot([0, 1], [1, 0])
+        return fig
+
+    render(tmp_path / "plot.svg", plot)
+    assert plt.get_fignums() == []
+
+
+def test_new_figure_is_configured():
+    from matplotlib import rcParams
+
+    from actions import FIG_SIZE, PLOT_DPI
+    from actions.plotting import new_figure
+
+    fig = new_figure()
+    assert tuple(fig.get_size_inches()) == FIG_SIZE
+    assert rcParams["savefig.dpi"] == PLOT_DPI
+    assert rcParams["font.family"] == ["sans-serif"]
+    assert plt.get_fignums() == []
+
+
+def test_configure_survives_rc_context():
+    from matplotlib import rc_context, rcParams
+
+    from actions import PLOT_DPI, render_pool
+    from actions.plotting import new_figure
+
+    dpis = []
+
+    def action():
+        new_figure()
+        dpis.append(rcParams["savefig.dpi"])
+
+    with rc_context({"savefig.dpi": "figure"}):
+        assert render_pool._execute((action, ())) is None
+        assert render_pool._execute((action, ())) is None
+        assert rcParams["savefig.dpi"] == "figure"  # restored after each action
+    assert dpis == [PLOT_DPI, PLOT_DPI]
+    with rc_context():
+        new_figure()
+    new_figure()
+    assert rcParams["savefig.dpi"] == PLOT_DPI
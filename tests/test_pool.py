@@ -0,0 +1,32 @@
+import pytest
+
+
+def test_run():
+    from actions.pool import report, run, shutdown
+
+    assert run("operator", "add", (1, 2)) == 3
+    assert run("os.path", "join", ("a", "b")) == "a/b"
+    stats = report()
+    assert stats["tasks"] == 2
+    assert stats["workers"] >= 1
+    assert stats["task_time"] >= 0
+    # the cold starts are measured, fresh processes import matplotlib
+    assert stats["cold_start_time"] > 0
+    assert stats["saved_time"] == pytest.approx(
+        stats["cold_start_time"] - stats["warm_up_per_process"] * stats["workers"]
+    )
+    shutdown()
+
+
+def test_run_inline_in_child_processes():
+    import multiprocessing
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    from actions.pool import run
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        child = executor.submit(os.getpid).result()
+        # no pool of its own, the function runs in the child itself
+        assert executor.submit(run, "os", "getpid", ()).result() == child
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+
+def test_wait(tmp_path):
+    from actions import render_pool
+
+    plot, stale, missing = (tmp_path / name for name in ("a.svg", "b.svg", "c.svg"))
+    stale.write_text("<svg/>")
+    render_pool.submit("ok", (Path.write_text, (plot, "<svg/>")), [plot])
+    render_pool.submit("failed", (Path.read_text, (missing,)), [missing])
+    render_pool.submit("false", (bool, ((),)), [stale])
+    errors = render_pool.wait()
+    assert set(errors) == {"failed", "false"}
+    assert "FileNotFoundError" in errors["failed"]
+    assert plot.read_text() == "<svg/>"
+    # the targets of a failed render are removed, so the task runs again
+    assert not stale.exists()
+    assert render_pool.wait() == {}
+    # kept for callers like the watch mode after doit's reporter waited
+    assert set(render_pool.errors) == {"failed", "false"}
+
+
+def test_failed_render_fails_the_run(tmp_path, monkeypatch):
+    import io
+
+    import pytest
+
+    from actions import render_pool, result_store, timing
+    from actions.dependencies import ReasonReporter
+
+    monkeypatch.setattr(timing, "timings_dir", tmp_path / "timings")
+    monkeypatch.setattr(result_store, "store_dir", tmp_path / "store")
+    missing = tmp_path / "missing.svg"
+    render_pool.submit("failed", (Path.read_text, (missing,)), [missing])
+    output = io.StringIO()
+    with pytest.raises(SystemExit) as exit:
+        ReasonReporter(output, {}).complete_run()
+    assert exit.value.code == 1
+    assert "Rendering failed failed" in output.getvalue()
+    # nothing left to wait for, a run without failed renders succeeds
+    ReasonReporter(output, {}).complete_run()
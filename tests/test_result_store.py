@@ -0,0 +1,104 @@
+from pathlib import Path
+
+
+def test_store(tmp_path, monkeypatch):
+    from actions import result_store
+
+    monkeypatch.setattr(result_store, "store_dir", tmp_path / "store")
+    lattice = tmp_path / "lattice.json"
+    lattice.write_text("{}")
+    calls = []
+
+    def action(target):
+        calls.append(target)
+        target.write_text("summary")
+
+    first, second = tmp_path / "a" / "summary.json", tmp_path / "b" / "summary.json"
+    first.parent.mkdir()
+    values = {"energy": 1700}
+    assert result_store.run((action, (first,)), [lattice], values, [first]) is None
+    assert result_store.run((action, (second,)), [lattice], values, [second])
+    assert calls == [first]
+    assert second.read_text() == "summary"
+    assert second.stat().st_ino != first.stat().st_ino
+
+    # the outputs stay writable and writing into them does not change the store
+    first.write_text("changed")
+    assert result_store.run((action, (second,)), [lattice], values, [second])
+    assert second.read_text() == "summary"
+
+    # a different value is a miss, and the stored file is not overwritten
+    result_store.run((action, (first,)), [lattice], {"energy": 1800}, [first])
+    assert calls == [first, first]
+    assert second.read_text() == "summary"
+
+
+def test_prune(tmp_path, monkeypatch):
+    import os
+
+    from actions import result_store
+
+    monkeypatch.setattr(result_store, "store_dir", tmp_path / "store")
+    target = tmp_path / "summary.json"
+    for i, size in enumerate([10, 20, 30]):
+        target.write_text("x" * size)
+        key = f"{i:02d}" + "0" * 62
+        result_store.store(key, [target])
+        os.utime(result_store.entry_dir(key), (i, 1e9 + i))
+
+    result_store.prune(max_size=30, max_age=1e12)
+    entries = (tmp_path / "store").glob("??/*")
+    assert [path.parent.name for path in entries] == ["02"]
+    result_store.prune(max_size=50, max_age=1)
+    assert list((tmp_path / "store").glob("??/*")) == []
+
+    # at most once per interval, e.g. by the runs of other machines
+    result_store.store("03" + "0" * 62, [target])
+    result_store.prune(max_size=0, interval=3600)
+    assert len(list((tmp_path / "store").glob("??/*"))) == 1
+
+
+def test_store_across_checkouts(tmp_path):
+    import shutil
+    import subprocess
+    import sys
+
+    root = Path(__file__).parent.parent
+    store = tmp_path / "store"
+    code = """
+import sys
+from pathlib import Path
+
+import dodo
+from actions import result_store, twiss_madx
+
+lattice = Path("lattice.madx")
+lattice.write_text("ring: line=();")
+values = dodo.store_values("madx", twiss_madx.tables_action, parameters={})
+target = Path("results", "twiss_tables.json")
+
+
+def action():
+    target.write_text(sys.argv[1])
+
+
+result_store.run((action, ()), [lattice], values, [target])
+print(target.read_text())
+"""
+    outputs = []
+    for checkout in ("a", "checkout_b"):
+        checkout = tmp_path / checkout
+        shutil.copytree(root / "actions", checkout / "actions")
+        shutil.copy(root / "dodo.py", checkout)
+        config = (root / "config.toml").read_text()
+        config = config.replace('"./_cache/results"', f'"{store}"')
+        (checkout / "config.toml").write_text(config)
+        output = subprocess.run(
+            [sys.executable, "-c", code, checkout.name],
+            cwd=checkout,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        outputs.append(output.split()[-1])
+    assert outputs == ["a", "a"]
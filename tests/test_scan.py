@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+
+def test_grid():
+    from actions.scan import grid, table
+
+    names, points = grid({"energy": [1700, 1800], "Q1.k1": [1.1, 1.2]})
+    assert names == ["energy", "Q1.k1"]
+    assert points == [(1700, 1.1), (1700, 1.2), (1800, 1.1), (1800, 1.2)]
+    results = [({"tune x": 1.0}, None), ({}, "TwissFailed()"), *[({}, None)] * 2]
+    data = table(names, points, results)
+    assert data["metrics"] == {"tune x": [1.0, None, None, None]}
+    assert data["errors"] == {1: "TwissFailed()"}
+
+
+def test_madx(fodo_ring, tmp_path):
+    pytest.importorskip("cpymad")
+    import latticejson
+
+    from actions.scan import action, target
+
+    lattice_path = tmp_path / "fodo.madx"
+    latticejson.save(fodo_ring, lattice_path)
+    lattice = {"energy": 1700, "scan": {"energy": [1700, 1800], "Q1.k1": [1.2, 1.3]}}
+    action("madx", lattice, lattice_path, tmp_path / "madx")
+
+    data = json.loads((tmp_path / "madx" / target).read_text())
+    tunes = data["metrics"]["tune x"]
+    assert data["errors"] == {}
+    assert tunes[0] == tunes[2] and tunes[1] == tunes[3]
+    assert tunes[1] > tunes[0]
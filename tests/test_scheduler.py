@@ -0,0 +1,57 @@
+import json
+import stat
+import sys
+
+
+def fake_elegant(path, script):
+    path.write_text(f"#!/bin/sh\n{script}\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_run(tmp_path, monkeypatch):
+    from actions import scheduler
+
+    monkeypatch.setattr(scheduler, "slots_dir", tmp_path / "slots")
+    elegant = fake_elegant(
+        tmp_path / "elegant",
+        'echo "running $1"; echo oops >&2\n'
+        f'{sys.executable} -c "import os; print(sorted(os.sched_getaffinity(0)))"',
+    )
+    log_path = tmp_path / "run.log"
+
+    assert scheduler.run([elegant, "twiss.ele"], log_path, concurrency=2)
+    assert "running twiss.ele" in log_path.read_text()
+    assert "oops" in log_path.read_text()
+    record = json.loads(log_path.with_suffix(".run.json").read_text())
+    assert record["returncode"] == 0
+    assert record["attempts"] == 1
+    assert f"{sorted(record['cpus'])}" in log_path.read_text()
+
+
+def test_peak_rss(tmp_path, monkeypatch):
+    from actions import scheduler
+
+    monkeypatch.setattr(scheduler, "slots_dir", tmp_path / "slots")
+    # memory of the parent, must not count for the forked child
+    ballast = b"x" * 256 * 2**20
+    elegant = fake_elegant(tmp_path / "elegant", "sleep 0.3")
+    log_path = tmp_path / "run.log"
+
+    assert scheduler.run([elegant], log_path)
+    record = json.loads(log_path.with_suffix(".run.json").read_text())
+    assert 0 < record["peak_rss"] < 32 * 2**20 < len(ballast)
+
+
+def test_timeout_and_retry(tmp_path, monkeypatch):
+    from actions import scheduler
+
+    monkeypatch.setattr(scheduler, "slots_dir", tmp_path / "slots")
+    elegant = fake_elegant(tmp_path / "elegant", "sleep 10")
+    log_path = tmp_path / "run.log"
+
+    assert not scheduler.run([elegant], log_path, timeout=0.2, retries=1)
+    record = json.loads(log_path.with_suffix(".run.json").read_text())
+    assert record["timed_out"]
+    assert record["attempts"] == 2
+    assert record["runtime"] < 5
@@ -0,0 +1,66 @@
+import struct
+
+import numpy as np
+import pytest
+
+header = """SDDS1
+!# little-endian
+&description text="Twiss parameters", &end
+&parameter name=nux, type=double, &end
+&parameter name=Stage, type=string, &end
+&parameter name=Step, type=long, fixed_value=1, &end
+&column name=s, units=m, type=double, &end
+&column name=betax, units=m, type=double, &end
+&column name=ElementName, type=string, &end
+&column name=ElementOccurence, type=long, &end
+&data mode=binary, {}&end
+"""
+rows = [(0.0, 10.0, "START", 1), (1.5, 12.5, "Q1", 1), (3.0, 9.0, "D1", 2)]
+
+
+def string(value):
+    return struct.pack("<i", len(value)) + value.encode()
+
+
+def write(path, column_major):
+    data = struct.pack("<i", len(rows)) + struct.pack("<d", 0.25) + string("twiss")
+    if column_major:
+        s, betax, names, occurences = zip(*rows)
+        data += struct.pack(f"<{len(rows)}d", *s)
+        data += struct.pack(f"<{len(rows)}d", *betax)
+        data += b"".join(map(string, names))
+        data += struct.pack(f"<{len(rows)}i", *occurences)
+    else:
+        for s, betax, name, occurence in rows:
+            data += struct.pack("<dd", s, betax) + string(name)
+            data += struct.pack("<i", occurence)
+    order = "column_major_order=1, " if column_major else ""
+    path.write_bytes(header.format(order).encode() + data)
+
+
+def test_read(tmp_path):
+    from actions.sdds import read
+
+    for column_major in (False, True):
+        path = tmp_path / "twiss.twi"
+        write(path, column_major)
+        data = read(path, columns=["betax", "ElementName"], parameters=["nux"])
+        assert set(data) == {"betax", "ElementName", "nux"}
+        assert data["nux"] == 0.25
+        np.testing.assert_array_equal(data["betax"], [10.0, 12.5, 9.0])
+        assert list(data["ElementName"]) == ["START", "Q1", "D1"]
+
+        data = read(path)
+        assert data["Step"] == 1 and isinstance(data["Step"], int)
+        assert data["Stage"] == "twiss"
+        np.testing.assert_array_equal(data["ElementOccurence"], [1, 1, 2])
+
+
+def test_arrays(tmp_path):
+    from actions.sdds import read
+
+    path = tmp_path / "arrays.sdds"
+    text = header.replace("&data", "&array name=matrix, type=double, &end\n&data")
+    path.write_text(text.format(""))
+    with pytest.raises(ValueError, match="matrix"):
+        read(path)
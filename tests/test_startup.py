@@ -0,0 +1,12 @@
+from benchmarks import startup
+
+
+def test_action_modules_import_no_heavy_modules():
+    for name, code in startup.targets().items():
+        if name.startswith("actions."):
+            assert startup.measure(code, repeat=1)["heavy"] == [], name
+
+
+def test_measure_lists_heavy_modules():
+    result = startup.measure("import numpy", repeat=1)
+    assert result["heavy"] == ["numpy"] and result["time"] > 0
@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+
+import pytest
+
+
+def stages():
+    from actions.timing import span
+
+    with span("twiss"):
+        with span("savefig"):
+            pass
+    return "done"
+
+
+def test_report(tmp_path, monkeypatch):
+    from actions import timing
+
+    monkeypatch.setattr(timing, "timings_dir", tmp_path)
+    monkeypatch.setenv("TIMING_RUN", "test")
+    task = "madx_simulation:test/fodo"
+    assert timing.task(task, __name__, "stages", ()) == "done"
+    timing.task("madx_plots:test/fodo", __name__, "stages", ())
+
+    result = timing.report()
+    assert result["tasks"] == 2
+    assert result["slowest_lattices"][0][0] == "test/fodo"
+    timings = json.loads((tmp_path / "test" / "fodo" / "timings.json").read_text())
+    assert set(timings) == {"madx_simulation", "madx_plots"}
+    assert set(timings["madx_simulation"]) == {
+        "task",
+        "task/twiss",
+        "task/twiss/savefig",
+    }
+    # only the innermost spans are ranked
+    assert sorted(stage for stage, _ in result["slowest_stages"]) == [
+        "madx_plots twiss/savefig",
+        "madx_simulation twiss/savefig",
+    ]
+    assert not (tmp_path / "runs" / "test").exists()
+    assert timing.report() is None
+
+
+def test_span_outside_task():
+    assert stages() == "done"
+
+
+def external(runs_dir):
+    from actions.timing import record
+
+    record("elegant", 2.0, 1.5, peak_rss=1024)
+    # the spans are written once the task has finished
+    assert not runs_dir.exists()
+
+
+def test_record_external(tmp_path, monkeypatch):
+    from actions import timing
+
+    monkeypatch.setattr(timing, "timings_dir", tmp_path)
+    monkeypatch.setenv("TIMING_RUN", "test")
+    timing.task(
+        "elegant_simulation:test/fodo", __name__, "external", (tmp_path / "runs",)
+    )
+    assert len(list((tmp_path / "runs" / "test").glob("*.jsonl"))) == 1
+
+    timing.report()
+    timings = json.loads((tmp_path / "test" / "fodo" / "timings.json").read_text())
+    assert timings["elegant_simulation"]["task/elegant"] == {
+        "wall": 2.0,
+        "cpu": 1.5,
+        "peak_rss": 1024,
+    }
+
+
+def allocating():
+    from actions.timing import span
+
+    with span("large"):
+        ballast = b"x" * 128 * 2**20
+        del ballast
+    with span("small"):
+        pass
+
+
+@pytest.mark.skipif(
+    not Path("/proc/self/clear_refs").exists(), reason="needs /proc/self/clear_refs"
+)
+def test_peak_rss(tmp_path, monkeypatch):
+    from actions import timing
+
+    monkeypatch.setattr(timing, "timings_dir", tmp_path)
+    monkeypatch.setenv("TIMING_RUN", "test")
+    timing.task("madx_simulation:test/fodo", __name__, "allocating", ())
+
+    timing.report()
+    timings = json.loads((tmp_path / "test" / "fodo" / "timings.json").read_text())
+    spans = {
+        name: span["peak_rss"] for name, span in timings["madx_simulation"].items()
+    }
+    # the peak of an earlier span does not count for the later one
+    assert spans["task/large"] > spans["task/small"] + 100 * 2**20
+    assert spans["task"] >= spans["task/large"]
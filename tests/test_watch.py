@@ -0,0 +1,38 @@
+def test_changed_files(tmp_path):
+    from actions.watch import changed_files, snapshot
+
+    (tmp_path / "test").mkdir()
+    info, lattice = tmp_path / "test" / "info.toml", tmp_path / "test" / "fodo.lte"
+    info.write_text("[fodo]")
+    (tmp_path / "test" / "notes.txt").write_text("")
+    before = snapshot(tmp_path)
+    assert list(before) == [info]
+    lattice.write_text("RING: LINE=();")
+    info.write_text("[fodo]\nenergy = 1700")
+    assert changed_files(before, snapshot(tmp_path)) == [lattice, info]
+
+
+def test_stages():
+    from actions.watch import stages
+
+    lattice = {"namespace": "test", "name": "fodo", "simulations": ["madx"]}
+    ring = {**lattice, "name": "ring", "scan": {}, "simulations": ["madx", "apace"]}
+    titles, tasks = zip(*stages([lattice, ring]))
+    assert titles == ("tables", "plots", "scans and comparison")
+    assert tasks[0][:4] == [
+        "index_json",
+        "convert_lattices:test/fodo",
+        "index_json_per_lattice:test/fodo",
+        "lattice_info:test/fodo",
+    ]
+    assert tasks[1] == [
+        "madx_plots:test/fodo",
+        "madx_plots:test/ring",
+        "apace_plots:test/ring",
+    ]
+    assert tasks[2] == [
+        "madx_scan:test/ring",
+        "apace_scan:test/ring",
+        "code_comparison:test/ring",
+        "comparison:test",
+    ]
@@ -0,0 +1,115 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from actions import work_queue
+
+
+def task(name, *deps):
+    return SimpleNamespace(name=name, targets=[], task_dep=list(deps), setup_tasks=[])
+
+
+def test_work(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "queue_path", tmp_path / "queue.sqlite")
+    connection = work_queue.connect()
+    tasks = [task("summary", "tables", "plots"), task("tables", "simulation")]
+    tasks += [task("plots", "simulation"), task("simulation"), task("broken")]
+    tasks += [task("after_broken", "broken")]
+    work_queue.publish(connection, tasks)
+
+    done, lock = [], threading.Lock()
+
+    def run(name, lost):
+        time.sleep(0.01)
+        with lock:
+            done.append(name)
+        return 1 if name == "broken" else 0
+
+    workers = [
+        threading.Thread(
+            target=work_queue.work, args=(run, f"worker-{i}"), kwargs={"poll": 0.01}
+        )
+        for i in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(done) == ["broken", "plots", "simulation", "summary", "tables"]
+    assert done.index("simulation") < done.index("tables") < done.index("summary")
+    assert work_queue.counts(connection) == {"done": 4, "failed": 1, "pending": 1}
+
+
+def test_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "queue_path", tmp_path / "queue.sqlite")
+    connection = work_queue.connect()
+    work_queue.publish(connection, [task("simulation")])
+
+    assert work_queue.claim(connection, "dead", lease=0.01) == "simulation"
+    assert work_queue.claim(connection, "alive") is None  # still leased
+    time.sleep(0.02)
+    # the lease of the dead worker expired, its late result is ignored
+    assert work_queue.claim(connection, "alive") == "simulation"
+    work_queue.complete(connection, "simulation", "dead", 1, 1.0)
+    work_queue.complete(connection, "simulation", "alive", 0, 1.0)
+    assert work_queue.counts(connection) == {"done": 1}
+
+    work_queue.publish(connection, [task("simulation")])
+    for _ in range(work_queue.MAX_ATTEMPTS):
+        assert work_queue.claim(connection, "dead", lease=0.0) == "simulation"
+        time.sleep(0.01)
+    assert work_queue.claim(connection, "alive") is None
+    assert work_queue.counts(connection) == {"failed": 1}
+
+
+def test_publish_during_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "queue_path", tmp_path / "queue.sqlite")
+    connection = work_queue.connect()
+    work_queue.publish(connection, [task("simulation"), task("tables")])
+    assert work_queue.claim(connection, "first") == "simulation"
+
+    # the running task keeps its worker, nobody else can claim it
+    work_queue.publish(connection, [task("simulation"), task("tables")])
+    assert work_queue.claim(connection, "second") == "tables"
+    assert work_queue.claim(connection, "second") is None
+    assert work_queue.renew(connection, "simulation", "first")
+    work_queue.complete(connection, "simulation", "first", 0, 1.0)
+    work_queue.complete(connection, "tables", "second", 0, 1.0)
+    assert work_queue.counts(connection) == {"done": 2}
+
+    # finished tasks are published again
+    work_queue.publish(connection, [task("tables")])
+    assert work_queue.counts(connection) == {"done": 1, "pending": 1}
+
+
+def test_lost_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(work_queue, "queue_path", tmp_path / "queue.sqlite")
+    connection = work_queue.connect()
+    work_queue.publish(connection, [task("simulation")])
+    target = tmp_path / "simulation.twi"
+
+    def simulation(stolen):
+        if stolen.exists():
+            return 0
+        # e.g. a stall of the worker, another one claims the task meanwhile
+        stolen.touch()
+        work_queue.connect().execute(
+            "UPDATE tasks SET worker = 'other', lease_until = ?", (time.time() + 0.5,)
+        )
+        time.sleep(5)
+        target.write_text("late")
+        return 0
+
+    def run(name, lost):
+        return work_queue.run_forked(simulation, (tmp_path / "stolen",), lost)
+
+    start = time.perf_counter()
+    assert work_queue.work(run, "worker", lease=0.3, poll=0.05) == {"done": 1}
+    assert time.perf_counter() - start < 5
+    # the run which lost the lease was killed before it wrote the target
+    assert not target.exists()
+    attempts, worker = connection.execute(
+        "SELECT attempts, worker FROM tasks"
+    ).fetchone()
+    assert (attempts, worker) == (2, "worker")